@@ -0,0 +1,96 @@
+import hashlib
+
+from team import schat_story_points, risico_analyse, split_story, analyse_acceptatiecriteria
+
+
+def huidige_story(responses):
+    """De story waar afgeleide artefacten op gebaseerd zijn: verfijnd, anders arbiter"""
+    return responses.get("verfijnd") or responses.get("arbiter") or ""
+
+
+class Artifact:
+    """Knoop in de artefact graaf.
+
+    `inputs` zijn keys uit current_responses (of "story", zie huidige_story).
+    Zonder `compute` is de knoop handmatig (bijv. verfijnd): hij wordt bij
+    gewijzigde inputs wel ongeldig gemaakt, maar niet automatisch herberekend.
+    """
+
+    def __init__(self, name, inputs, compute=None):
+        self.name = name
+        self.inputs = inputs
+        self.compute = compute
+
+
+class ArtifactGraph:
+    """Afhankelijkheden tussen de artefacten van een refinement.
+
+    Per artefact wordt een fingerprint (hash van de inputs) bijgehouden van
+    het moment waarop het berekend is. Wijkt die af van de huidige inputs,
+    dan is het artefact verouderd en worden alleen de afhankelijke knopen
+    ongeldig gemaakt en opnieuw gepland.
+    """
+
+    def __init__(self, artifacts):
+        # Volgorde is topologisch: een knoop komt na al zijn inputs
+        self.artifacts = {artifact.name: artifact for artifact in artifacts}
+
+    def _value(self, responses, key):
+        return huidige_story(responses) if key == "story" else responses.get(key) or ""
+
+    def fingerprint(self, responses, name):
+        """Hash van de inputs van `name`, of None als een input nog ontbreekt"""
+        values = [self._value(responses, key) for key in self.artifacts[name].inputs]
+        if not all(values):
+            return None
+        return hashlib.sha256("\0".join(values).encode("utf-8")).hexdigest()
+
+    def args(self, responses, name):
+        return [self._value(responses, key) for key in self.artifacts[name].inputs]
+
+    def invalidate(self, responses, fingerprints):
+        """Maak verouderde artefacten leeg; geeft de namen terug die gewist zijn"""
+        cleared = []
+        for name in self.artifacts:
+            if not responses.get(name):
+                continue
+            if fingerprints.get(name) != self.fingerprint(responses, name):
+                responses[name] = ""
+                fingerprints.pop(name, None)
+                cleared.append(name)
+        return cleared
+
+    def mark_fresh(self, responses, fingerprints, names=None):
+        """Markeer aanwezige artefacten als actueel (bijv. na laden uit de geschiedenis)"""
+        for name in names or self.artifacts:
+            if responses.get(name):
+                fingerprints[name] = self.fingerprint(responses, name)
+
+    def plan(self, responses, running=None, failed=None):
+        """Artefacten die berekend kunnen worden: (naam, functie, args, fingerprint).
+
+        `running` is een dict naam -> fingerprint van jobs die al lopen; die
+        worden alleen opnieuw gepland als hun inputs inmiddels veranderd zijn.
+        `failed` (naam -> fingerprint van een mislukte berekening) werkt
+        hetzelfde: met dezelfde inputs wordt niet automatisch opnieuw geprobeerd.
+        """
+        running = running or {}
+        failed = failed or {}
+        planned = []
+        for name, artifact in self.artifacts.items():
+            if artifact.compute is None or responses.get(name):
+                continue
+            fingerprint = self.fingerprint(responses, name)
+            if fingerprint is None or fingerprint in (running.get(name), failed.get(name)):
+                continue
+            planned.append((name, artifact.compute, self.args(responses, name), fingerprint))
+        return planned
+
+
+GRAPH = ArtifactGraph([
+    Artifact("verfijnd", ("arbiter",)),
+    Artifact("story_points", ("story",), schat_story_points),
+    Artifact("risico_analyse", ("story",), risico_analyse),
+    Artifact("subtaken", ("story",), split_story),
+    Artifact("acceptatie", ("story",), analyse_acceptatiecriteria),
+])
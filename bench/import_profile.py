@@ -0,0 +1,113 @@
+"""Import-tijd profiel van de app bij een koude start.
+
+Draait `python -X importtime` over alle top-level imports van streamlit.py
+(behalve streamlit zelf) en rapporteert de totale importtijd, de duurste
+modules en per directe import de cumulatieve tijd. Als regressiecheck faalt
+het script (exit 1) als een zware module bij het opstarten geladen wordt of
+als de totale tijd boven het budget komt.
+
+Gebruik:
+    python bench/import_profile.py
+    python bench/import_profile.py --budget-ms 800 --json import_profile.json
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules die alleen lui (op het pad dat ze nodig heeft) geladen mogen worden
+HEAVY_MODULES = ("pandas", "graphviz", "openai", "chromadb", "sentence_transformers", "torch")
+
+
+def app_imports(path=os.path.join(ROOT, "streamlit.py")):
+    """Top-level modules die de app bij het opstarten importeert"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            names = [node.module]
+        else:
+            continue
+        # streamlit.py schaduwt het streamlit package buiten `streamlit run`
+        modules += [name for name in names if name.split(".")[0] != "streamlit" and name not in modules]
+    return modules
+
+
+def profile(modules):
+    """Eén koude start: lijst van (naam, diepte, self_us, cumulatief_us)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def summarize(rows, modules, top=15):
+    direct = {name: cumulative for name, depth, _, cumulative in rows if depth == 0}
+    return {
+        "total_ms": sum(direct.values()) / 1000.0,
+        "modules": len(rows),
+        "direct": {name: direct.get(name, 0) / 1000.0 for name in modules},
+        "slowest": [
+            {"module": name, "self_ms": self_us / 1000.0, "cumulative_ms": cumulative / 1000.0}
+            for name, _, self_us, cumulative in sorted(rows, key=lambda r: -r[2])[:top]
+        ],
+        "heavy": sorted({name.split(".")[0] for name, *_ in rows} & set(HEAVY_MODULES)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-tijd profiel en regressiecheck van de app")
+    parser.add_argument("--repeat", type=int, default=3, help="Aantal koude starts (de snelste telt)")
+    parser.add_argument("--top", type=int, default=15, help="Aantal duurste modules in het rapport")
+    parser.add_argument("--budget-ms", type=float, default=0, help="Maximale totale importtijd (0 = geen check)")
+    parser.add_argument("--allow", nargs="*", default=[], help="Zware modules die bij het opstarten mogen laden")
+    parser.add_argument("--json", help="Schrijf het profiel ook als JSON naar dit bestand")
+    args = parser.parse_args(argv)
+
+    modules = app_imports()
+    runs = [summarize(profile(modules), modules, args.top) for _ in range(args.repeat)]
+    report = min(runs, key=lambda r: r["total_ms"])
+
+    print(f"Koude start: {report['total_ms']:.0f} ms voor {report['modules']} modules "
+          f"(snelste van {args.repeat})")
+    print("\nDirecte imports (cumulatief):")
+    for name, ms in sorted(report["direct"].items(), key=lambda item: -item[1]):
+        print(f"  {name:<24}{ms:>9.1f} ms")
+    print("\nDuurste modules (eigen tijd):")
+    for row in report["slowest"]:
+        print(f"  {row['module']:<40}{row['self_ms']:>9.1f} ms{row['cumulative_ms']:>10.1f} ms cumulatief")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    heavy = [name for name in report["heavy"] if name not in args.allow]
+    if heavy:
+        failures.append(f"zware modules bij het opstarten geladen: {', '.join(heavy)}")
+    if args.budget_ms and report["total_ms"] > args.budget_ms:
+        failures.append(f"importtijd {report['total_ms']:.0f} ms boven budget van {args.budget_ms:.0f} ms")
+    for failure in failures:
+        print(f"\nREGRESSIE: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
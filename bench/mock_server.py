@@ -0,0 +1,191 @@
+"""Lokale OpenAI-compatibele stand-in server voor benchmarks.
+
+Implementeert POST /v1/chat/completions (gewoon en gestreamd via SSE) met
+instelbare latency, streaming snelheid en foutpercentage. De usage bevat
+ook prompt_cache_hit_tokens, gesimuleerd op basis van eerder geziene
+system berichten (zoals DeepSeek prefix caching).
+
+Gebruik:
+    python bench/mock_server.py --port 8765 --latency 0.5 --tokens-per-second 50 --error-rate 0.02
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("de", "gebruiker", "wil", "kunnen", "inloggen", "zodat", "het", "systeem", "veilig",
+         "blijft", "en", "data", "beschikbaar", "is", "acceptatiecriteria", "test", "scenario")
+
+
+class MockConfig:
+    def __init__(self, latency=0.3, jitter=0.1, tokens_per_second=100.0, completion_tokens=200,
+                 error_rate=0.0, error_status=429, straggler_rate=0.0, straggler_delay=5.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.straggler_rate = straggler_rate  # kans op een uitschieter met extra vertraging
+        self.straggler_delay = straggler_delay
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, zodat connection pooling meetbaar is
+    config = MockConfig()
+    seen_prefixes = set()
+    lock = threading.Lock()
+    requests = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _usage(self, messages, completion_tokens):
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4 + 4 * len(messages)
+        system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+        prefix = hashlib.sha256(system.encode("utf-8")).hexdigest()
+        with self.lock:
+            hit = prefix in self.seen_prefixes
+            self.seen_prefixes.add(prefix)
+        # DeepSeek cachet in eenheden van 64 tokens
+        hit_tokens = (len(system) // 4 // 64) * 64 if hit else 0
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_cache_hit_tokens": hit_tokens,
+            "prompt_cache_miss_tokens": prompt_tokens - hit_tokens
+        }
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        with self.lock:
+            MockHandler.requests += 1
+        config = self.config
+
+        delay = max(0.0, random.gauss(config.latency, config.jitter))
+        if random.random() < config.straggler_rate:
+            delay += config.straggler_delay
+        time.sleep(delay)
+        if random.random() < config.error_rate:
+            self._send_json(
+                config.error_status,
+                {"error": {"message": "mock error", "type": "rate_limit_error"}},
+                headers={"Retry-After": "0.1"} if config.error_status == 429 else None
+            )
+            return
+
+        n_tokens = min(body.get("max_tokens") or config.completion_tokens, config.completion_tokens)
+        tokens = ["5"] + [random.choice(WORDS) for _ in range(n_tokens - 1)]
+        finish_reason = "length" if n_tokens < config.completion_tokens else "stop"
+        usage = self._usage(body.get("messages", []), n_tokens)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "mock")
+
+        if not body.get("stream"):
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(tokens)},
+                    "finish_reason": finish_reason
+                }],
+                "usage": usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        delay = 1.0 / config.tokens_per_second if config.tokens_per_second else 0.0
+        for idx, token in enumerate(tokens):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token if idx == 0 else " " + token},
+                             "finish_reason": None}]
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            if delay:
+                time.sleep(delay)
+        final = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]
+        }
+        self._write_chunk(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            usage_chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                           "model": model, "choices": [], "usage": usage}
+            self._write_chunk(f"data: {json.dumps(usage_chunk)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+
+def start_server(config, host="127.0.0.1", port=0):
+    """Start de mock server in een achtergrondthread; geeft (server, base_url) terug"""
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.3, help="Gemiddelde tijd tot eerste token (s)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Standaardafwijking van de latency (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0, help="Streaming snelheid")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="Tokens per antwoord")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Kans op een foutantwoord (0-1)")
+    parser.add_argument("--error-status", type=int, default=429, help="HTTP status van foutantwoorden")
+    parser.add_argument("--straggler-rate", type=float, default=0.0, help="Kans op een trage uitschieter (0-1)")
+    parser.add_argument("--straggler-delay", type=float, default=5.0, help="Extra vertraging van een uitschieter (s)")
+
+
+def config_from_args(args):
+    return MockConfig(
+        latency=args.latency, jitter=args.jitter, tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens, error_rate=args.error_rate, error_status=args.error_status,
+        straggler_rate=args.straggler_rate, straggler_delay=args.straggler_delay
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatibele mock server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server, base_url = start_server(config_from_args(args), args.host, args.port)
+    print(f"Mock server op {base_url} (LLM_BASE_URL={base_url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,208 @@
+"""Load- en latency benchmark van de refinement keten tegen een lokale mock server.
+
+Elke gesimuleerde sessie draait de volledige keten (teamlid_1 -> teamlid_2 ->
+arbiter) en daarna de afgeleide acties (story points, risicoanalyse, taken
+splitsen, verfijnen). Per concurrency niveau worden p50/p95/p99 latency en
+throughput gerapporteerd.
+
+Gebruik:
+    python bench/run_bench.py --concurrency 1 10 100 --sessions 100 --latency 0.3 --stream
+    python bench/run_bench.py --base-url http://localhost:8765/v1   # eigen server
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_server import start_server, add_arguments, config_from_args  # noqa: E402
+from token_profiles import percentile  # noqa: E402
+
+
+class Recorder:
+    """Verzamelt latencies per stage (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.ttft = {}
+        self.errors = 0
+
+    def add(self, name, latency, ttft=None, ok=True):
+        with self._lock:
+            self.latencies.setdefault(name, []).append(latency)
+            if ttft is not None:
+                self.ttft.setdefault(name, []).append(ttft)
+            if not ok:
+                self.errors += 1
+
+
+def timed(recorder, name, fn, *args, stream=False):
+    """Roep een teamlid-functie aan en registreer latency (en TTFT bij streaming)"""
+    start = time.perf_counter()
+    ttft = None
+    if stream:
+        parts = []
+        for part in fn(*args, stream=True):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            parts.append(part)
+        result = "".join(parts) or None
+    else:
+        result = fn(*args)
+    recorder.add(name, time.perf_counter() - start, ttft, ok=result is not None)
+    return result
+
+
+def timed_job(recorder, name, fn, *args):
+    """Draai fn als achtergrondjob via JobManager, zoals de UI dat doet (fn(*args, stream=True))"""
+    from jobs import get_job_manager, DONE
+    manager = get_job_manager()
+    start = time.perf_counter()
+    job = manager.get(manager.submit(fn, *args, label=name))
+    while not job.done:
+        time.sleep(0.01)
+    recorder.add(name, time.perf_counter() - start, ok=job.status == DONE)
+    if job.error:
+        print(f"{name}: {job.error}", file=sys.stderr)
+    return job.result
+
+
+def run_session(session_no, recorder, stream):
+    from llm import set_options
+    from team import (teamlid_1, teamlid_2, teamlid_3_arbiter, schat_story_points,
+                      risico_analyse, split_story, verfijn_user_story, documentatie,
+                      chat_with_teamlid, CHAT_BUDGET)
+
+    # Unieke prompt en geen response cache: elke sessie raakt de server echt
+    set_options(use_cache=False, session_id=f"bench-{session_no}")
+    prompt = f"Als klant wil ik mijn bestellingen kunnen exporteren (sessie {session_no}, {random.random()})"
+    start = time.perf_counter()
+    t1 = timed(recorder, "teamlid1", teamlid_1, prompt, stream=stream)
+    docs = documentatie(prompt)
+    t2 = t1 and timed(recorder, "teamlid2", partial(teamlid_2, docs=docs), prompt, t1, stream=stream)
+    arbiter = t2 and timed(recorder, "arbiter", partial(teamlid_3_arbiter, docs=docs), prompt, t1, t2, stream=stream)
+    recorder.add("chain", time.perf_counter() - start, ok=bool(arbiter))
+    if not arbiter:
+        return
+    timed(recorder, "story_points", schat_story_points, arbiter, stream=stream)
+    timed(recorder, "risico_analyse", risico_analyse, arbiter, stream=stream)
+    timed(recorder, "split_story", split_story, arbiter, stream=stream)
+    timed(recorder, "verfijn", verfijn_user_story, arbiter, "Meer details over authenticatie", stream=stream)
+    # Team Chat met een lopend gesprek, ingediend als job met dezelfde argumenten als de UI
+    gesprek = {"summary": "", "turns": [{"question": prompt, "answer": arbiter}]}
+    timed_job(recorder, "chat", chat_with_teamlid, "Senior Developer", "Hoe testen we dit?", gesprek, CHAT_BUDGET)
+    recorder.add("session", time.perf_counter() - start)
+
+
+def run_level(concurrency, sessions, stream):
+    recorder = Recorder()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda n: run_session(n, recorder, stream), range(sessions)))
+    elapsed = time.perf_counter() - start
+    calls = sum(len(v) for k, v in recorder.latencies.items() if k not in ("chain", "session"))
+    result = {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "stream": stream,
+        "elapsed_s": elapsed,
+        "sessions_per_s": sessions / elapsed,
+        "calls_per_s": calls / elapsed,
+        "errors": recorder.errors,
+        "stages": {}
+    }
+    for name, values in recorder.latencies.items():
+        result["stages"][name] = {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+        if name in recorder.ttft:
+            result["stages"][name]["ttft_p50"] = percentile(recorder.ttft[name], 50)
+            result["stages"][name]["ttft_p95"] = percentile(recorder.ttft[name], 95)
+    return result
+
+
+def print_report(result):
+    print(f"\n== concurrency {result['concurrency']} | {result['sessions']} sessies | "
+          f"{'stream' if result['stream'] else 'blocking'} ==")
+    print(f"duur {result['elapsed_s']:.1f}s, {result['sessions_per_s']:.2f} sessies/s, "
+          f"{result['calls_per_s']:.1f} calls/s, {result['errors']} fouten")
+    print(f"{'stage':<16}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'ttft p50':>10}")
+    order = ["teamlid1", "teamlid2", "arbiter", "chain", "story_points", "risico_analyse",
+             "split_story", "verfijn", "session"]
+    for name in sorted(result["stages"], key=lambda n: order.index(n) if n in order else len(order)):
+        s = result["stages"][name]
+        ttft = f"{s['ttft_p50']:.3f}" if "ttft_p50" in s else "-"
+        print(f"{name:<16}{s['count']:>6}{s['p50']:>9.3f}{s['p95']:>9.3f}{s['p99']:>9.3f}{ttft:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de refinement keten")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--sessions", type=int, default=0,
+                        help="Sessies per niveau (standaard 2x de concurrency, minimaal 5)")
+    parser.add_argument("--stream", action="store_true", help="Gebruik streaming calls (meet ook TTFT)")
+    parser.add_argument("--base-url", help="Gebruik een draaiende server in plaats van de ingebouwde mock")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Schrijf de resultaten ook als JSON naar dit bestand")
+    parser.add_argument("--hedge", action="store_true", help="Zet hedged requests aan (LLM_HEDGE=1)")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server, base_url = start_server(config_from_args(args))
+
+    # Geïsoleerde state: geen echte API key, cache of grootboek aanraken
+    workdir = tempfile.mkdtemp(prefix="ai-scrum-bench-")
+    os.environ["LLM_BASE_URL"] = base_url
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, "cache.sqlite3")
+    os.environ["LEDGER_PATH"] = os.path.join(workdir, "ledger.sqlite3")
+    os.environ["BUDGET_SESSION_USD"] = "0"
+    os.environ["BUDGET_DAILY_USD"] = "0"
+    if args.hedge:
+        os.environ["LLM_HEDGE"] = "1"
+
+    from llm_client import pool_stats
+    from ratelimit import get_limiter
+    from usage import get_usage_stats
+    from hedge import get_hedge_stats
+
+    print(f"Server: {base_url}, LLM_MAX_CONCURRENCY={get_limiter().max_concurrency}")
+    results = []
+    for concurrency in args.concurrency:
+        sessions = args.sessions or max(2 * concurrency, 5)
+        result = run_level(concurrency, sessions, args.stream)
+        result["pool"] = pool_stats()
+        result["limiter"] = get_limiter().stats()
+        result["hedge"] = get_hedge_stats().stats()
+        print_report(result)
+        results.append(result)
+    print(f"\nconnection pool: {json.dumps(pool_stats())}")
+    print(f"prefix cache hit rate: {get_usage_stats().summary()['cache_hit_rate']:.0%}")
+    if args.hedge:
+        hedge = get_hedge_stats().stats()
+        print(f"hedges: {hedge['fired']} gestart, {hedge['won']} gewonnen")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
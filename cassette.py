@@ -0,0 +1,95 @@
+"""Record/replay van LLM calls ("cassette") voor offline ontwikkeling en profilering.
+
+In record mode wordt elke call van generate_response met zijn tekstfragmenten
+en timing weggeschreven naar een gzip JSONL bestand. In replay mode komen de
+antwoorden uit dat bestand, zonder netwerk, budget of limiter: op de
+opgenomen snelheid (LLM_CASSETTE_SPEED=1) of direct (0, standaard).
+
+Gebruik:
+    LLM_CASSETTE_MODE=record streamlit run streamlit.py
+    LLM_CASSETTE_MODE=replay LLM_CASSETTE_SPEED=1 streamlit run streamlit.py
+"""
+import gzip
+import json
+import os
+import threading
+import time
+
+RECORD = "record"
+REPLAY = "replay"
+DEFAULT_PATH = os.path.join("data", "cassette.jsonl.gz")
+
+
+class CassetteMiss(Exception):
+    """Geen opname voor deze call in replay mode"""
+
+
+class Cassette:
+    """Opnames per request key; een key die vaker is opgenomen speelt in volgorde af"""
+
+    def __init__(self, path, mode, speed=0.0):
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._interactions = {}  # key -> [opname, ...]
+        self._positions = {}
+        if mode == REPLAY and os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        interaction = json.loads(line)
+                        self._interactions.setdefault(interaction["key"], []).append(interaction)
+        elif mode == RECORD and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def record(self, key, stage, model, timed_parts, started):
+        """Schrijf één call weg; `timed_parts` zijn (tijdstip, tekst) paren, tijden in ms sinds de vorige"""
+        chunks = []
+        previous = started
+        for moment, text in timed_parts:
+            chunks.append([int((moment - previous) * 1000), text])
+            previous = moment
+        line = json.dumps({"key": key, "stage": stage, "model": model, "chunks": chunks},
+                          ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            # Elke append is een los gzip member; gzip.open leest ze achter elkaar
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def replay(self, key):
+        """De volgende opname voor `key`, of None; na de laatste blijft de laatste terugkomen"""
+        with self._lock:
+            interactions = self._interactions.get(key)
+            if not interactions:
+                return None
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            return interactions[min(position, len(interactions) - 1)]
+
+    def play(self, interaction):
+        """Tekstfragmenten van een opname, met de opgenomen timing x speed"""
+        for delay_ms, text in interaction["chunks"]:
+            if self.speed and delay_ms:
+                time.sleep(delay_ms / 1000.0 * self.speed)
+            yield text
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """Proces-brede cassette, of None als LLM_CASSETTE_MODE niet record of replay is"""
+    global _cassette
+    mode = os.getenv("LLM_CASSETTE_MODE", "")
+    if mode not in (RECORD, REPLAY):
+        return None
+    with _cassette_lock:
+        if _cassette is None or _cassette.mode != mode:
+            _cassette = Cassette(
+                os.getenv("LLM_CASSETTE", DEFAULT_PATH),
+                mode,
+                float(os.getenv("LLM_CASSETTE_SPEED", 0))
+            )
+        return _cassette
@@ -0,0 +1,70 @@
+"""Begrensde gesprekscontext voor de Team Chat.
+
+Per rol wordt een context bijgehouden: een doorlopende samenvatting van
+oudere beurten plus de recente beurten letterlijk. De prompt blijft zo
+onder een vast token budget, hoe lang het gesprek ook wordt.
+"""
+from ratelimit import estimate_tokens
+
+DEFAULT_BUDGET = 2000
+KEEP_RECENT = 2  # zoveel beurten blijven altijd letterlijk staan
+
+
+def new_context():
+    return {"summary": "", "turns": [], "compacting": None}
+
+
+def _tokens(text):
+    return estimate_tokens([{"content": text}])
+
+
+def _turn_tokens(turn):
+    return _tokens(turn["question"]) + _tokens(turn["answer"])
+
+
+def context_tokens(context):
+    return _tokens(context["summary"]) + sum(_turn_tokens(turn) for turn in context["turns"])
+
+
+def build_messages(system, context, question, budget=DEFAULT_BUDGET):
+    """Berichten voor een chatvraag: instructies, samenvatting, recente beurten, vraag.
+
+    Recente beurten worden van nieuw naar oud toegevoegd zolang ze binnen het
+    budget passen; de rest zit (na compactie) in de samenvatting.
+    """
+    messages = [{"role": "system", "content": system}]
+    used = _tokens(question)
+    if context and context["summary"]:
+        messages.append({"role": "system", "content": f"Samenvatting van het eerdere gesprek:\n{context['summary']}"})
+        used += _tokens(context["summary"])
+    recent = []
+    for turn in reversed(context["turns"] if context else []):
+        cost = _turn_tokens(turn)
+        if used + cost > budget:
+            break
+        recent.insert(0, turn)
+        used += cost
+    for turn in recent:
+        messages.append({"role": "user", "content": turn["question"]})
+        messages.append({"role": "assistant", "content": turn["answer"]})
+    messages.append({"role": "user", "content": question})
+    return messages
+
+
+def needs_compaction(context, budget=DEFAULT_BUDGET):
+    """True als de context over het budget gaat en er oudere beurten zijn om samen te vatten"""
+    return (context["compacting"] is None
+            and len(context["turns"]) > KEEP_RECENT
+            and context_tokens(context) > budget)
+
+
+def turns_to_fold(context):
+    """Beurten die in de samenvatting opgaan: alles behalve de laatste KEEP_RECENT"""
+    return context["turns"][:-KEEP_RECENT]
+
+
+def apply_summary(context, summary, folded):
+    """Vervang de eerste `folded` beurten door de nieuwe samenvatting"""
+    context["summary"] = summary
+    context["turns"] = context["turns"][folded:]
+    context["compacting"] = None
@@ -0,0 +1,65 @@
+"""Opdelen van lange invoer (hele specificaties) voor map-reduce samenvatten.
+
+Invoer boven LONG_INPUT_TOKENS wordt op alinea's in delen van ongeveer
+LONG_INPUT_CHUNK_TOKENS gesplitst. De delen worden parallel samengevat en
+daarna tot één brief gecombineerd (zie team.condenseer_input); alleen die
+brief gaat door de keten.
+"""
+import os
+
+from ratelimit import estimate_tokens
+
+DEFAULT_THRESHOLD = 3000
+DEFAULT_CHUNK_TOKENS = 2000
+DEFAULT_WORKERS = 4
+REDUCE_INPUT_TOKENS = 6000  # maximale invoer van één combineer-call
+
+
+def tokens(text):
+    return estimate_tokens([{"content": text}])
+
+
+def threshold():
+    return int(os.getenv("LONG_INPUT_TOKENS", DEFAULT_THRESHOLD))
+
+
+def needs_condensing(text):
+    return tokens(text or "") > threshold()
+
+
+def _hard_split(paragraph, max_chars):
+    """Splits een te lange alinea op regels, en als het moet midden in een regel"""
+    parts, current = [], ""
+    for line in paragraph.splitlines(keepends=True):
+        while len(line) > max_chars:
+            parts.append(current + line[:max_chars - len(current)])
+            line = line[max_chars - len(current):]
+            current = ""
+        if len(current) + len(line) > max_chars:
+            parts.append(current)
+            current = ""
+        current += line
+    if current:
+        parts.append(current)
+    return [part for part in parts if part.strip()]
+
+
+def chunk_text(text, chunk_tokens=None):
+    """Delen van hooguit ~chunk_tokens tokens, bij voorkeur op alineagrenzen"""
+    chunk_tokens = chunk_tokens or int(os.getenv("LONG_INPUT_CHUNK_TOKENS", DEFAULT_CHUNK_TOKENS))
+    max_chars = chunk_tokens * 4  # zelfde schatting als ratelimit.estimate_tokens
+    return pack([p for p in text.split("\n\n") if p.strip()], max_chars, split=True)
+
+
+def pack(pieces, max_chars, split=False):
+    """Voeg opeenvolgende stukken samen tot groepen van hooguit max_chars tekens"""
+    groups, current = [], ""
+    for piece in pieces:
+        for part in (_hard_split(piece, max_chars) if split and len(piece) > max_chars else [piece]):
+            if current and len(current) + len(part) + 2 > max_chars:
+                groups.append(current)
+                current = ""
+            current = f"{current}\n\n{part}" if current else part
+    if current:
+        groups.append(current)
+    return groups
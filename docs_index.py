@@ -0,0 +1,208 @@
+"""Persistente retrieval index over de projectdocumentatie.
+
+Bestanden uit de docs map (DOCS_PATH) worden in stukken geknipt, ge-embed
+met sentence-transformers en in een Chroma collectie bewaard. Bijwerken is
+incrementeel: een manifest houdt per bestand de inhoudshash bij, zodat
+alleen nieuwe of gewijzigde bestanden opnieuw ge-embed worden (in batches)
+en verwijderde bestanden uit de index verdwijnen. Bij een refinement worden
+de meest relevante stukken aan teamlid_2 en de arbiter meegegeven.
+
+Gebruik:
+    python docs_index.py                 # docs map incrementeel indexeren
+    python docs_index.py --rebuild       # alles opnieuw
+    python docs_index.py --query "betalingen via iDEAL"
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+
+from dotenv import load_dotenv
+
+import condense
+from semantic_cache import is_available, get_encoder
+
+DEFAULT_DOCS_PATH = "docs"
+DEFAULT_INDEX_PATH = os.path.join(".cache", "docs_index")
+DEFAULT_TOP_K = 4
+DEFAULT_MIN_SIMILARITY = 0.3
+DEFAULT_CONTEXT_TOKENS = 1500
+CHUNK_TOKENS = 400
+EMBED_BATCH = 64
+EXTENSIONS = (".md", ".markdown", ".txt", ".rst")
+COLLECTION = "docs"
+
+
+def manifest_path(index_path=None):
+    return os.path.join(index_path or os.getenv("DOCS_INDEX_PATH", DEFAULT_INDEX_PATH), "manifest.json")
+
+
+def read_manifest(index_path=None):
+    """Manifest van de geïndexeerde bestanden; leesbaar zonder het embedding model te laden"""
+    path = manifest_path(index_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def summary(index_path=None):
+    manifest = read_manifest(index_path)
+    return {
+        "files": len(manifest),
+        "chunks": sum(entry["chunks"] for entry in manifest.values()),
+        "docs_path": os.getenv("DOCS_PATH", DEFAULT_DOCS_PATH)
+    }
+
+
+class DocsIndex:
+    def __init__(self, docs_path=None, index_path=None, model_name=None):
+        # Zware imports pas laden als de index echt gebruikt wordt
+        import chromadb
+
+        self.docs_path = docs_path or os.getenv("DOCS_PATH", DEFAULT_DOCS_PATH)
+        index_path = index_path or os.getenv("DOCS_INDEX_PATH", DEFAULT_INDEX_PATH)
+        os.makedirs(index_path, exist_ok=True)
+        self._manifest_path = manifest_path(index_path)
+        self._model = get_encoder(model_name)
+        self._client = chromadb.PersistentClient(path=index_path)
+        self._collection = self._client.get_or_create_collection(COLLECTION, metadata={"hnsw:space": "cosine"})
+        self._lock = threading.Lock()
+        self.manifest = read_manifest(index_path)  # relatief pad -> {"hash", "chunks"}
+
+    def _save_manifest(self):
+        tmp = self._manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp, self._manifest_path)
+
+    def _files(self):
+        for root, _, names in os.walk(self.docs_path):
+            for name in sorted(names):
+                if name.lower().endswith(EXTENSIONS):
+                    path = os.path.join(root, name)
+                    yield os.path.relpath(path, self.docs_path).replace(os.sep, "/"), path
+
+    def _embed(self, texts):
+        return self._model.encode(texts, normalize_embeddings=True, batch_size=EMBED_BATCH).tolist()
+
+    def _flush(self, pending, done):
+        """Embed en schrijf de verzamelde stukken weg; pas daarna gelden de bestanden als geïndexeerd"""
+        if pending:
+            self._collection.upsert(
+                ids=[item[0] for item in pending],
+                embeddings=self._embed([item[1] for item in pending]),
+                documents=[item[1] for item in pending],
+                metadatas=[item[2] for item in pending]
+            )
+        for rel, entry in done:
+            self.manifest[rel] = entry
+        self._save_manifest()
+
+    def update(self, rebuild=False):
+        """Indexeer nieuwe en gewijzigde bestanden; geeft tellers terug"""
+        stats = {"indexed": 0, "unchanged": 0, "removed": 0, "chunks": 0}
+        with self._lock:
+            if rebuild:
+                self._client.delete_collection(COLLECTION)
+                self._collection = self._client.get_or_create_collection(
+                    COLLECTION, metadata={"hnsw:space": "cosine"}
+                )
+                self.manifest = {}
+            seen = set()
+            pending, done = [], []
+            for rel, path in self._files():
+                seen.add(rel)
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    text = f.read()
+                digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                if self.manifest.get(rel, {}).get("hash") == digest:
+                    stats["unchanged"] += 1
+                    continue
+                if rel in self.manifest:
+                    self._collection.delete(where={"path": rel})
+                chunks = condense.chunk_text(text, CHUNK_TOKENS) if text.strip() else []
+                pending += [(f"{rel}#{i}", chunk, {"path": rel, "chunk": i}) for i, chunk in enumerate(chunks)]
+                done.append((rel, {"hash": digest, "chunks": len(chunks)}))
+                stats["indexed"] += 1
+                stats["chunks"] += len(chunks)
+                if len(pending) >= EMBED_BATCH:
+                    self._flush(pending, done)
+                    pending, done = [], []
+            self._flush(pending, done)
+            for rel in [rel for rel in self.manifest if rel not in seen]:
+                self._collection.delete(where={"path": rel})
+                del self.manifest[rel]
+                stats["removed"] += 1
+            self._save_manifest()
+        return stats
+
+    def search(self, query, k=None, min_similarity=None):
+        """De k meest relevante stukken: [{"path", "text", "similarity"}]"""
+        k = k or int(os.getenv("DOCS_TOP_K", DEFAULT_TOP_K))
+        min_similarity = min_similarity if min_similarity is not None else float(
+            os.getenv("DOCS_MIN_SIMILARITY", DEFAULT_MIN_SIMILARITY)
+        )
+        with self._lock:
+            if self._collection.count() == 0:
+                return []
+            result = self._collection.query(
+                query_embeddings=self._embed([query]),
+                n_results=min(k, self._collection.count()),
+                include=["documents", "metadatas", "distances"]
+            )
+        hits = []
+        for text, meta, distance in zip(result["documents"][0], result["metadatas"][0], result["distances"][0]):
+            if 1.0 - distance >= min_similarity:
+                hits.append({"path": meta["path"], "text": text, "similarity": 1.0 - distance})
+        return hits
+
+    def context_for(self, query, max_tokens=None):
+        """Relevante documentatie als tekstblok met bronvermelding, binnen een token budget"""
+        max_tokens = max_tokens or int(os.getenv("DOCS_CONTEXT_TOKENS", DEFAULT_CONTEXT_TOKENS))
+        blocks, used = [], 0
+        for hit in self.search(query):
+            block = f"[bron: {hit['path']}]\n{hit['text']}"
+            cost = condense.tokens(block)
+            if used + cost > max_tokens:
+                break
+            blocks.append(block)
+            used += cost
+        return "\n\n".join(blocks)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_docs_index():
+    """Proces-brede documentatie index, of None als de dependencies ontbreken"""
+    global _index
+    if not is_available():
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = DocsIndex()
+        return _index
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Indexeer de projectdocumentatie voor retrieval")
+    parser.add_argument("--rebuild", action="store_true", help="Gooi de index weg en indexeer alles opnieuw")
+    parser.add_argument("--query", help="Toon de relevante stukken voor deze zoekvraag")
+    args = parser.parse_args(argv)
+    index = get_docs_index()
+    if index is None:
+        parser.error("chromadb en sentence-transformers zijn niet geïnstalleerd")
+    stats = index.update(rebuild=args.rebuild)
+    print(f"{stats['indexed']} bestanden geïndexeerd ({stats['chunks']} stukken), "
+          f"{stats['unchanged']} ongewijzigd, {stats['removed']} verwijderd")
+    if args.query:
+        for hit in index.search(args.query):
+            print(f"\n[{hit['similarity']:.2f}] {hit['path']}\n{hit['text'][:300]}")
+
+
+if __name__ == "__main__":
+    main()
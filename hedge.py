@@ -0,0 +1,174 @@
+"""Hedged requests tegen trage uitschieters.
+
+Komt het eerste token van een call niet binnen de drempel van zijn stage
+(het p95 van eerder gemeten time-to-first-token), dan wordt dezelfde call
+nog eens gestart, eventueel tegen een tweede endpoint. De stream die het
+eerst een token levert wint; de andere wordt meteen gesloten (ook als hij
+nog aan het openen is) en zijn limiter-slot vrijgegeven.
+"""
+import contextvars
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from token_profiles import percentile
+
+DEFAULT_WINDOW = 100  # laatste N metingen per stage
+DEFAULT_MIN_SAMPLES = 10  # zonder genoeg metingen wordt er niet gehedged
+DEFAULT_PERCENTILE = 95
+MIN_THRESHOLD = 0.2  # seconden; voorkomt hedgen op ruis
+
+
+class HedgeStats:
+    """Time-to-first-token per stage en tellers van afgevuurde en gewonnen hedges"""
+
+    def __init__(self, percentile=None, min_samples=None):
+        self.percentile = percentile or float(os.getenv("LLM_HEDGE_PERCENTILE", DEFAULT_PERCENTILE))
+        self.min_samples = min_samples or int(os.getenv("LLM_HEDGE_MIN_SAMPLES", DEFAULT_MIN_SAMPLES))
+        self._lock = threading.Lock()
+        self._ttft = {}
+        self.fired = 0
+        self.won = 0
+
+    def observe(self, stage, ttft):
+        with self._lock:
+            self._ttft.setdefault(stage or "overig", deque(maxlen=DEFAULT_WINDOW)).append(ttft)
+
+    def threshold(self, stage):
+        """Drempel in seconden, of None zolang er te weinig metingen zijn"""
+        with self._lock:
+            values = list(self._ttft.get(stage or "overig", ()))
+        if len(values) < self.min_samples:
+            return None
+        return max(percentile(values, self.percentile), MIN_THRESHOLD)
+
+    def record(self, fired, won):
+        with self._lock:
+            self.fired += fired
+            self.won += won
+
+    def stats(self):
+        with self._lock:
+            stages = list(self._ttft)
+            fired, won = self.fired, self.won
+        return {
+            "fired": fired,
+            "won": won,
+            "win_rate": won / fired if fired else 0.0,
+            "thresholds_ms": {
+                stage: int(threshold * 1000)
+                for stage in stages
+                for threshold in [self.threshold(stage)] if threshold
+            }
+        }
+
+
+class _Attempt:
+    """Eén poging met handle naar zijn stream, zodat de winnaar hem direct kan afbreken"""
+
+    def __init__(self, index):
+        self.index = index
+        self.lock = threading.Lock()
+        self.stream = None
+        self.cancelled = False
+        self.reported = False  # resultaat met bezet limiter-slot staat in de queue
+
+    def cancel(self, limiter):
+        """Sluit de verliezer meteen; loopt hij nog, dan ruimt _attempt hem op zodra hij terugkomt"""
+        with self.lock:
+            self.cancelled = True
+            stream, reported = self.stream, self.reported
+        if stream is not None:
+            stream.close()  # onderbreekt ook een lopende read in de andere thread
+        if reported:
+            limiter.release()
+
+
+def _attempt(attempt, open_stream, results, started, limiter):
+    """Open een stream en lees het eerste chunk; het resultaat gaat naar de queue"""
+    try:
+        stream = open_stream()
+    except Exception as e:
+        results.put((attempt, time.monotonic() - started, None, None, None, e))
+        return
+    with attempt.lock:
+        attempt.stream = stream
+        cancelled = attempt.cancelled
+    error = None
+    if not cancelled:
+        try:
+            chunks = iter(stream)
+            first = next(chunks, None)
+        except Exception as e:
+            error = e
+    with attempt.lock:
+        cancelled = attempt.cancelled
+        attempt.reported = not cancelled and error is None
+    if cancelled or error is not None:
+        stream.close()
+        limiter.release()
+        if not cancelled:
+            results.put((attempt, time.monotonic() - started, None, None, None, error))
+        return
+    results.put((attempt, time.monotonic() - started, stream, chunks, first, None))
+
+
+def open_hedged(open_primary, open_hedge, stage, limiter, stats):
+    """Open een stream met hedging: (stream, chunks) van de winnende poging.
+
+    `open_primary` en `open_hedge` openen elk een stream binnen een
+    limiter-slot (zie ratelimit.call_with_retry). Het slot van de winnaar
+    blijft bezet; de aanroeper geeft het vrij zoals bij een gewone stream.
+    De verliezer wordt direct gesloten en zijn slot vrijgegeven.
+    """
+    results = queue.Queue()
+    started = time.monotonic()
+    attempts = []
+
+    def start(open_stream):
+        attempt = _Attempt(len(attempts))
+        attempts.append(attempt)
+        context = contextvars.copy_context()
+        threading.Thread(
+            target=context.run, args=(_attempt, attempt, open_stream, results, started, limiter),
+            name=f"llm-hedge-{attempt.index}", daemon=True
+        ).start()
+
+    start(open_primary)
+    threshold = stats.threshold(stage)
+    try:
+        result = results.get(timeout=threshold) if threshold else results.get()
+    except queue.Empty:
+        start(open_hedge)
+        result = results.get()
+    if result[5] is not None and len(attempts) > 1:
+        # Eerste poging faalde: wacht op de andere
+        result = results.get()
+    attempt, ttft, stream, chunks, first, error = result
+    if attempt.index == 0 and error is None:
+        stats.observe(stage, ttft)
+    elif attempt.index == 1 and error is None:
+        # Afgebroken primary: de verstreken tijd is een ondergrens van zijn TTFT
+        stats.observe(stage, time.monotonic() - started)
+    stats.record(len(attempts) - 1, int(attempt.index == 1 and error is None))
+    for other in attempts:
+        if other is not attempt:
+            other.cancel(limiter)
+    if error is not None:
+        raise error
+    return stream, itertools.chain([first] if first is not None else [], chunks)
+
+
+_stats = None
+_stats_lock = threading.Lock()
+
+
+def get_hedge_stats():
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = HedgeStats()
+        return _stats
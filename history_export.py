@@ -0,0 +1,125 @@
+"""Bulk export van de refinement geschiedenis naar Jira CSV, Markdown of JSONL.
+
+Alles loopt via generators: entries komen per batch uit de history store,
+worden per stuk geformatteerd en direct gecomprimeerd weggeschreven. Het
+geheugengebruik blijft zo constant, ook bij duizenden stories.
+
+Gebruik:
+    python history_export.py --format csv -o export.csv.gz
+    python history_export.py --format md --query betaling --since 2024-01-01 -o betaling.md.gz
+"""
+import argparse
+import csv
+import io
+import json
+import zlib
+
+from dotenv import load_dotenv
+
+from history_store import get_history_store
+from team import jira_story_data, jira_row, parse_story_points, JIRA_COLUMNS
+
+FORMATS = {
+    "csv": ("Jira CSV", "csv"),
+    "md": ("Markdown", "md"),
+    "jsonl": ("JSONL", "jsonl"),
+}
+CHUNK_SIZE = 64 * 1024
+
+
+def story_markdown(responses, title="User Story"):
+    """Markdown van één refinement (zelfde opbouw als de losse export)"""
+    markdown = f"# {title}\n\n{responses['arbiter']}\n\n"
+    if responses.get("verfijnd"):
+        markdown += f"## Verfijnde Versie\n\n{responses['verfijnd']}\n\n"
+    if responses.get("acceptatie"):
+        markdown += f"## Acceptatiecriteria\n\n```gherkin\n{responses['acceptatie']}\n```\n\n"
+    if responses.get("subtaken"):
+        markdown += f"## Opgesplitste Taken\n\n{responses['subtaken']}\n\n"
+    return markdown
+
+
+def jira_csv_chunks(entries):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=JIRA_COLUMNS)
+    writer.writeheader()
+    for entry in entries:
+        responses = entry["responses"]
+        points = parse_story_points(responses.get("story_points"))
+        writer.writerow(jira_row(jira_story_data(responses, points=points)))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def markdown_chunks(entries):
+    for entry in entries:
+        title = f"User Story #{entry['id']} ({entry['timestamp']})"
+        yield story_markdown(entry["responses"], title) + "---\n\n"
+
+
+def jsonl_chunks(entries):
+    for entry in entries:
+        yield json.dumps(entry, ensure_ascii=False) + "\n"
+
+
+FORMATTERS = {"csv": jira_csv_chunks, "md": markdown_chunks, "jsonl": jsonl_chunks}
+
+
+def export_chunks(fmt, query="", since=None, until=None, stats=None):
+    """Tekstfragmenten van de export; entries zonder story worden overgeslagen.
+
+    `stats` (optioneel dict) krijgt het aantal geëxporteerde entries.
+    """
+    def entries():
+        for entry in get_history_store().iter_entries(query, since, until):
+            if entry["responses"]["arbiter"]:
+                if stats is not None:
+                    stats["entries"] = stats.get("entries", 0) + 1
+                yield entry
+    return FORMATTERS[fmt](entries())
+
+
+def gzip_chunks(chunks, level=6):
+    """Comprimeer tekstfragmenten tot gzip bytes, in blokken van CHUNK_SIZE"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip formaat
+    pending = []
+    size = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            pending.append(data)
+            size += len(data)
+        if size >= CHUNK_SIZE:
+            yield b"".join(pending)
+            pending, size = [], 0
+    pending.append(compressor.flush())
+    yield b"".join(pending)
+
+
+def write_export(path, fmt, query="", since=None, until=None):
+    """Schrijf een gzip export naar `path`; geeft het aantal entries terug"""
+    stats = {}
+    with open(path, "wb") as f:
+        for data in gzip_chunks(export_chunks(fmt, query, since, until, stats)):
+            f.write(data)
+    return stats.get("entries", 0)
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Exporteer de refinement geschiedenis (gzip)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("-o", "--output", help="Uitvoerbestand (standaard history_export.<format>.gz)")
+    parser.add_argument("--query", default="", help="Zoekterm (zelfde zoekfunctie als de sidebar)")
+    parser.add_argument("--since", help="Vanaf datum (YYYY-MM-DD)")
+    parser.add_argument("--until", help="Tot en met datum (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+    output = args.output or f"history_export.{FORMATS[args.format][1]}.gz"
+    count = write_export(output, args.format, args.query, args.since, args.until)
+    print(f"{count} stories geëxporteerd naar {output}")
+
+
+if __name__ == "__main__":
+    main()
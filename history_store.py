@@ -0,0 +1,182 @@
+import datetime
+import os
+import re
+import sqlite3
+import threading
+
+DEFAULT_PATH = os.path.join("data", "history.sqlite3")
+
+# Velden van current_responses die doorzoekbaar zijn
+RESPONSE_FIELDS = (
+    "teamlid1", "teamlid2", "arbiter", "subtaken", "acceptatie",
+    "verfijnd", "story_points", "risico_analyse"
+)
+
+
+def _fts_query(query):
+    """Zet vrije zoektekst om naar een veilige FTS5 query (prefix match per woord)"""
+    tokens = re.findall(r"\w+", query, flags=re.UNICODE)
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+class HistoryStore:
+    """Refinement geschiedenis in SQLite met een FTS5 index over prompt en responses.
+
+    Alle queries zijn gepagineerd, zodat de sidebar per rerun een vaste
+    hoeveelheid werk doet, ongeacht hoe groot de geschiedenis is.
+    """
+
+    def __init__(self, path=None):
+        path = path or os.getenv("HISTORY_DB_PATH", DEFAULT_PATH)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        columns = ", ".join(f"{field} TEXT NOT NULL DEFAULT ''" for field in RESPONSE_FIELDS)
+        fts_columns = ", ".join(("prompt",) + RESPONSE_FIELDS)
+        new_columns = ", ".join(f"new.{c}" for c in ("prompt",) + RESPONSE_FIELDS)
+        old_columns = ", ".join(f"old.{c}" for c in ("prompt",) + RESPONSE_FIELDS)
+        self._conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS refinements (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                {columns}
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS refinements_fts USING fts5(
+                {fts_columns}, content='refinements', content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS refinements_ai AFTER INSERT ON refinements BEGIN
+                INSERT INTO refinements_fts(rowid, {fts_columns}) VALUES (new.id, {new_columns});
+            END;
+            CREATE TRIGGER IF NOT EXISTS refinements_ad AFTER DELETE ON refinements BEGIN
+                INSERT INTO refinements_fts(refinements_fts, rowid, {fts_columns})
+                VALUES ('delete', old.id, {old_columns});
+            END;
+            CREATE TRIGGER IF NOT EXISTS refinements_au AFTER UPDATE ON refinements BEGIN
+                INSERT INTO refinements_fts(refinements_fts, rowid, {fts_columns})
+                VALUES ('delete', old.id, {old_columns});
+                INSERT INTO refinements_fts(rowid, {fts_columns}) VALUES (new.id, {new_columns});
+            END;
+        """)
+        self._conn.commit()
+
+    def add(self, prompt, responses, timestamp=None):
+        """Sla een refinement op en geef het id terug"""
+        timestamp = timestamp or datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+        values = [responses.get(field) or "" for field in RESPONSE_FIELDS]
+        with self._lock:
+            cursor = self._conn.execute(
+                f"INSERT INTO refinements (timestamp, prompt, {', '.join(RESPONSE_FIELDS)}) "
+                f"VALUES (?, ?, {', '.join('?' for _ in RESPONSE_FIELDS)})",
+                [timestamp, prompt] + values
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def update(self, entry_id, responses):
+        assignments = ", ".join(f"{field} = ?" for field in RESPONSE_FIELDS)
+        values = [responses.get(field) or "" for field in RESPONSE_FIELDS]
+        with self._lock:
+            self._conn.execute(f"UPDATE refinements SET {assignments} WHERE id = ?", values + [entry_id])
+            self._conn.commit()
+
+    def delete(self, entry_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM refinements WHERE id = ?", (entry_id,))
+            self._conn.commit()
+
+    def get(self, entry_id):
+        """Volledige entry met "responses" dict, of None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM refinements WHERE id = ?", (entry_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "timestamp": row["timestamp"],
+            "prompt": row["prompt"],
+            "responses": {field: row[field] for field in RESPONSE_FIELDS}
+        }
+
+    def count(self, query=""):
+        fts = _fts_query(query)
+        with self._lock:
+            if fts:
+                return self._conn.execute(
+                    "SELECT COUNT(*) FROM refinements_fts WHERE refinements_fts MATCH ?", (fts,)
+                ).fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM refinements").fetchone()[0]
+
+    def page(self, query="", offset=0, limit=10):
+        """Eén pagina samenvattingen, nieuwste eerst of op relevantie bij een zoekterm"""
+        fts = _fts_query(query)
+        with self._lock:
+            if fts:
+                rows = self._conn.execute("""
+                    SELECT r.id, r.timestamp, substr(r.prompt, 1, 200) AS prompt, r.verfijnd != '' AS verfijnd,
+                           snippet(refinements_fts, -1, '**', '**', '…', 12) AS snippet
+                    FROM refinements_fts
+                    JOIN refinements r ON r.id = refinements_fts.rowid
+                    WHERE refinements_fts MATCH ?
+                    ORDER BY bm25(refinements_fts)
+                    LIMIT ? OFFSET ?
+                """, (fts, limit, offset)).fetchall()
+            else:
+                rows = self._conn.execute("""
+                    SELECT id, timestamp, substr(prompt, 1, 200) AS prompt, verfijnd != '' AS verfijnd,
+                           '' AS snippet
+                    FROM refinements
+                    ORDER BY id DESC
+                    LIMIT ? OFFSET ?
+                """, (limit, offset)).fetchall()
+        return [dict(row) for row in rows]
+
+    def iter_entries(self, query="", since=None, until=None, batch_size=200):
+        """Alle (gefilterde) entries als generator, oudste eerst.
+
+        Leest in batches op id (keyset paginering), zodat ook een export van
+        duizenden stories maar één batch tegelijk in het geheugen houdt.
+        `since` en `until` zijn datums ("YYYY-MM-DD", inclusief).
+        """
+        fts = _fts_query(query)
+        where, params = ["r.id > ?"], []
+        if fts:
+            where.append("r.id IN (SELECT rowid FROM refinements_fts WHERE refinements_fts MATCH ?)")
+            params.append(fts)
+        if since:
+            where.append("r.timestamp >= ?")
+            params.append(str(since))
+        if until:
+            where.append("r.timestamp < ?")
+            params.append(f"{until}~")  # "~" sorteert na elke tijd op die dag
+        sql = f"SELECT r.* FROM refinements r WHERE {' AND '.join(where)} ORDER BY r.id LIMIT ?"
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(sql, [last_id] + params + [batch_size]).fetchall()
+            for row in rows:
+                yield {
+                    "id": row["id"],
+                    "timestamp": row["timestamp"],
+                    "prompt": row["prompt"],
+                    "responses": {field: row[field] for field in RESPONSE_FIELDS}
+                }
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1]["id"]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """Proces-brede history store"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+        return _store
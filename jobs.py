@@ -0,0 +1,115 @@
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from llm import set_options
+
+DEFAULT_WORKERS = 8
+DEFAULT_TTL = 3600  # afgeronde jobs worden na een uur opgeruimd
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    def __init__(self, label, owner=None, key=None):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.owner = owner
+        self.key = key
+        self.status = QUEUED
+        self.partial = ""  # tekst die tot nu toe gestreamd is
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED)
+
+
+class JobManager:
+    """Proces-brede worker pool voor LLM werk, los van st.session_state.
+
+    Jobs lopen door als de gebruiker elders klikt of het script opnieuw
+    draait; de UI vraagt de status op via het job id.
+    """
+
+    def __init__(self, workers=None, ttl=DEFAULT_TTL):
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers or int(os.getenv("JOB_WORKERS", DEFAULT_WORKERS)),
+            thread_name_prefix="llm-job"
+        )
+        self._jobs = {}
+        self._keys = {}  # single-flight: key -> job id
+        self._lock = threading.Lock()
+        self.ttl = ttl
+
+    def submit(self, fn, *args, label="", owner=None, key=None):
+        """Start fn(*args, stream=True) op de achtergrond en geef het job id terug.
+
+        De call-opties van de aanroeper (cache, sessie id) gaan mee; fouten
+        worden op de job vastgelegd in plaats van in de UI getoond. Met een
+        `key` is de submit single-flight: zolang er voor die key een job loopt
+        of bewaard wordt, krijgt elke aanroep hetzelfde job id terug in plaats
+        van een nieuwe call. Een mislukte job wordt niet gedeeld.
+        """
+        context = contextvars.copy_context()
+        with self._lock:
+            self._cleanup()
+            existing = self._jobs.get(self._keys.get(key)) if key is not None else None
+            if existing is not None and existing.status != FAILED:
+                return existing.id
+            job = Job(label, owner, key)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._keys[key] = job.id
+        self._pool.submit(context.run, self._run, job, fn, args)
+        return job.id
+
+    def _run(self, job, fn, args):
+        errors = []
+        set_options(on_error=errors.append)
+        job.status = RUNNING
+        try:
+            for part in fn(*args, stream=True):
+                job.partial += part
+        except Exception as e:
+            errors.append(str(e))
+        job.result = job.partial or None
+        job.error = "; ".join(errors) or None
+        job.status = DONE if job.result else FAILED
+        job.finished = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs_for(self, owner):
+        with self._lock:
+            return [job for job in self._jobs.values() if job.owner == owner]
+
+    def _cleanup(self):
+        now = time.time()
+        for job in [j for j in self._jobs.values() if j.done and now - j.finished > self.ttl]:
+            del self._jobs[job.id]
+            if job.key is not None and self._keys.get(job.key) == job.id:
+                del self._keys[job.key]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
@@ -0,0 +1,154 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.path.join("data", "ledger.sqlite3")
+
+# Prijzen in USD per miljoen tokens; overschrijfbaar met LEDGER_PRICES (JSON)
+PRICES = {
+    "deepseek-chat": {"input_hit": 0.07, "input_miss": 0.27, "output": 1.10},
+    "deepseek-reasoner": {"input_hit": 0.14, "input_miss": 0.55, "output": 2.19},
+}
+DEFAULT_PRICE = PRICES["deepseek-chat"]
+
+# Budget acties
+REJECT = "reject"
+DOWNGRADE = "downgrade"
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def estimate_cost(model, usage):
+    """Geschatte kosten in USD van één call"""
+    prices = _prices().get(model, DEFAULT_PRICE)
+    return (
+        usage["cache_hit_tokens"] * prices["input_hit"]
+        + usage["cache_miss_tokens"] * prices["input_miss"]
+        + usage["completion_tokens"] * prices["output"]
+    ) / 1_000_000
+
+
+def _prices():
+    override = os.getenv("LEDGER_PRICES")
+    return {**PRICES, **json.loads(override)} if override else PRICES
+
+
+class Ledger:
+    """Persistent grootboek van alle API calls: tokens, latency en kosten.
+
+    Budgets (USD) gelden per sessie en per dag over alle sessies heen.
+    """
+
+    def __init__(self, path=None, session_budget=None, daily_budget=None, action=None):
+        path = path or os.getenv("LEDGER_PATH", DEFAULT_PATH)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.session_budget = session_budget if session_budget is not None else float(
+            os.getenv("BUDGET_SESSION_USD", 0)
+        )
+        self.daily_budget = daily_budget if daily_budget is not None else float(
+            os.getenv("BUDGET_DAILY_USD", 0)
+        )
+        self.action = action or os.getenv("BUDGET_ACTION", REJECT)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                day TEXT NOT NULL,
+                session_id TEXT,
+                stage TEXT,
+                model TEXT,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                cache_hit_tokens INTEGER NOT NULL,
+                latency_ms INTEGER NOT NULL,
+                cost REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_calls_day ON calls(day);
+            CREATE INDEX IF NOT EXISTS idx_calls_session ON calls(session_id);
+            CREATE INDEX IF NOT EXISTS idx_calls_stage ON calls(stage);
+        """)
+        self._conn.commit()
+
+    def record(self, stage, model, usage, latency, session_id=None):
+        cost = estimate_cost(model, usage)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO calls (ts, day, session_id, stage, model, prompt_tokens, completion_tokens, "
+                "cache_hit_tokens, latency_ms, cost) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (now, datetime.date.today().isoformat(), session_id, stage or "overig", model,
+                 usage["prompt_tokens"], usage["completion_tokens"], usage["cache_hit_tokens"],
+                 int(latency * 1000), cost)
+            )
+            self._conn.commit()
+        return cost
+
+    def _total(self, where, params):
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT COALESCE(SUM(cost), 0) FROM calls WHERE {where}", params
+            ).fetchone()[0]
+
+    def session_cost(self, session_id):
+        return self._total("session_id = ?", (session_id,))
+
+    def daily_cost(self, day=None):
+        return self._total("day = ?", (day or datetime.date.today().isoformat(),))
+
+    def check_budget(self, session_id=None):
+        """Geef None terug als er budget is, anders de ingestelde actie"""
+        if self.daily_budget and self.daily_cost() >= self.daily_budget:
+            return self.action
+        if self.session_budget and session_id and self.session_cost(session_id) >= self.session_budget:
+            return self.action
+        return None
+
+    def completion_tokens(self, stage, limit=500):
+        """Outputlengtes van de laatste `limit` calls van een stage"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT completion_tokens FROM calls WHERE stage = ? ORDER BY id DESC LIMIT ?",
+                (stage or "overig", limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def stage_summary(self, day=None, session_id=None):
+        """Totalen per stage voor een dag, optioneel beperkt tot één sessie"""
+        where, params = "day = ?", [day or datetime.date.today().isoformat()]
+        if session_id:
+            where += " AND session_id = ?"
+            params.append(session_id)
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT stage, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens),
+                       AVG(latency_ms), SUM(cost)
+                FROM calls WHERE {where}
+                GROUP BY stage ORDER BY SUM(cost) DESC
+            """, params).fetchall()
+        return [
+            {"stage": stage, "calls": calls, "prompt_tokens": prompt_tokens,
+             "completion_tokens": completion_tokens, "avg_latency_ms": int(latency or 0), "cost": cost}
+            for stage, calls, prompt_tokens, completion_tokens, latency, cost in rows
+        ]
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger():
+    """Proces-breed grootboek"""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = Ledger()
+        return _ledger
@@ -0,0 +1,232 @@
+import contextvars
+import os
+import sys
+import time
+
+from llm_cache import get_cache, cache_key
+from llm_client import get_client, get_hedge_client
+from ratelimit import get_limiter, call_with_retry, estimate_tokens
+from usage import normalize_usage, get_usage_stats
+from ledger import get_ledger, BudgetExceeded, REJECT, DOWNGRADE
+from token_profiles import get_token_profiles
+from routing import get_router
+from hedge import open_hedged, get_hedge_stats
+from cassette import get_cassette, CassetteMiss, REPLAY
+
+DEFAULT_DOWNGRADE_MAX_TOKENS = 1000
+
+# Opties per sessie/thread (bijv. cache aan/uit, foutmelding in de UI).
+# Nieuwe threads starten met de standaardwaarden.
+_options = contextvars.ContextVar("llm_options", default={})
+
+
+def set_options(**options):
+    """Stel call-opties in voor de huidige sessie of thread"""
+    _options.set({**_options.get(), **options})
+
+
+def get_option(name, default=None):
+    return _options.get().get(name, default)
+
+
+def report(message):
+    """Meld een fout via de on_error optie van de aanroeper, anders op stderr"""
+    handler = get_option("on_error")
+    if handler:
+        handler(message)
+    else:
+        print(message, file=sys.stderr)
+
+
+def _report_error(e):
+    report(f"API Fout: {str(e)}")
+
+
+def _apply_budget(model, max_tokens):
+    """Pas het budget toe: (model, max_tokens, afgewezen)"""
+    action = get_ledger().check_budget(get_option("session_id"))
+    if action == DOWNGRADE:
+        max_tokens = min(max_tokens, int(os.getenv("BUDGET_DOWNGRADE_MAX_TOKENS", DEFAULT_DOWNGRADE_MAX_TOKENS)))
+        return os.getenv("BUDGET_DOWNGRADE_MODEL", model), max_tokens, False
+    return model, max_tokens, action == REJECT
+
+
+def _record(stage, model, usage, started, limiter):
+    """Verwerk de usage van een afgeronde call in limiter, statistieken en grootboek"""
+    limiter.charge(usage["completion_tokens"])
+    get_usage_stats().record(stage, usage)
+    get_ledger().record(stage, model, usage, time.monotonic() - started, session_id=get_option("session_id"))
+
+
+def generate_response(model, messages, max_tokens=5000, stream=False, use_cache=True, stage=None):
+    """Gecentraliseerde functie voor API calls met error handling.
+
+    Met stream=True komt er een generator van tekstfragmenten terug, zodat
+    st.write_stream de tokens direct toont en daarna de volledige tekst geeft.
+    Identieke calls worden uit de persistente response cache beantwoord,
+    tenzij use_cache=False. `stage` labelt de call voor usage en kosten.
+    Boven het sessie- of dagbudget wordt de call afgewezen of afgeschaald.
+    `max_tokens` is een plafond: de werkelijke limiet komt uit het token
+    profiel van de stage (zie token_profiles) en de sessie-optie max_tokens.
+    Het model komt uit de tier van de stage (zie routing); `model` geldt
+    alleen voor stages zonder tier. Met hedging aan (optie/env LLM_HEDGE)
+    loopt ook een blokkerende call intern als stream, zodat een trage
+    eerste token een hedge request kan starten (zie hedge).
+    Met LLM_CASSETTE_MODE=record/replay worden calls opgenomen of zonder
+    netwerk afgespeeld (zie cassette); de response cache doet dan niet mee.
+    """
+    temperature = 0.7  # Meer creativiteit toestaan
+    use_cache = use_cache and get_option("use_cache", True)
+    model, tier = get_router().route(stage, model)
+    cassette = get_cassette()
+    record = None
+    if cassette is not None:
+        use_cache = False
+        request_key = cache_key(model, messages, max_tokens, temperature)
+        if cassette.mode == REPLAY:
+            return _replay(cassette, request_key, stage, stream)
+        record = (cassette, request_key)
+    model, max_tokens, rejected = _apply_budget(model, max_tokens)
+    # De cache key gebruikt het plafond, zodat een bijgestelde limiet de cache niet ongeldig maakt
+    key = cache_key(model, messages, max_tokens, temperature)
+    max_tokens = get_token_profiles().limit(stage, min(max_tokens, get_option("max_tokens") or max_tokens))
+    if not stream and _hedging():
+        parts = list(_stream_response(model, messages, max_tokens, temperature, key if use_cache else None,
+                                      stage, rejected, tier, record))
+        return "".join(parts) or None
+    if stream:
+        return _stream_response(model, messages, max_tokens, temperature, key if use_cache else None, stage, rejected,
+                                tier, record)
+    if use_cache:
+        cached = get_cache().get(key)
+        if cached is not None:
+            return cached
+    if rejected:
+        _report_error(BudgetExceeded("Budget overschreden, probeer het later opnieuw"))
+        return None
+    limiter = get_limiter()
+    started = time.monotonic()
+    try:
+        response = call_with_retry(
+            lambda: get_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            ),
+            limiter,
+            tokens=estimate_tokens(messages)
+        )
+    except Exception as e:
+        _report_error(e)
+        return None
+    limiter.release()
+    get_router().observe(tier, time.monotonic() - started)
+    usage = normalize_usage(response.usage)
+    if usage:
+        _record(stage, model, usage, started, limiter)
+    content = response.choices[0].message.content
+    truncated = response.choices[0].finish_reason == "length"
+    if truncated:
+        get_token_profiles().truncated(stage)
+    # Afgekapte antwoorden niet cachen: met een ruimere limiet komt er een volledig antwoord
+    if use_cache and content and not truncated:
+        get_cache().set(key, content, model=model)
+    if record and content:
+        record[0].record(record[1], stage, model, [(time.monotonic(), content)], started)
+    return content
+
+
+def _replay(cassette, key, stage, stream):
+    """Antwoord uit de cassette; zonder opname een fout (replay is strikt, dus deterministisch)"""
+    interaction = cassette.replay(key)
+    if interaction is None:
+        _report_error(CassetteMiss(f"Geen opname voor deze call (stage {stage})"))
+        return iter(()) if stream else None
+    if stream:
+        return cassette.play(interaction)
+    return "".join(cassette.play(interaction)) or None
+
+
+def _hedging():
+    return get_option("hedge", os.getenv("LLM_HEDGE", "0") == "1")
+
+
+def _stream_response(model, messages, max_tokens, temperature, key=None, stage=None, rejected=False, tier=None,
+                     record=None):
+    """Generator die de tekstfragmenten van een gestreamde completion oplevert"""
+    if key:
+        cached = get_cache().get(key)
+        if cached is not None:
+            yield cached
+            return
+    if rejected:
+        _report_error(BudgetExceeded("Budget overschreden, probeer het later opnieuw"))
+        return
+    parts = []
+    timed_parts = []  # (tijdstip, tekst) voor de cassette
+    usage = None
+    truncated = False
+    limiter = get_limiter()
+    started = time.monotonic()
+
+    def open_stream(client):
+        return lambda: call_with_retry(
+            lambda: client().chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                stream_options={"include_usage": True}
+            ),
+            limiter,
+            tokens=estimate_tokens(messages)
+        )
+
+    hedge_stats = get_hedge_stats()
+    hedging = _hedging()
+    try:
+        if hedging:
+            _, chunks = open_hedged(open_stream(get_client), open_stream(get_hedge_client),
+                                    stage, limiter, hedge_stats)
+        else:
+            chunks = iter(open_stream(get_client)())
+    except Exception as e:
+        _report_error(e)
+        return
+    # Het limiter-slot blijft bezet zolang de stream loopt
+    first_chunk = not hedging  # open_hedged meet de time-to-first-token zelf
+    try:
+        for chunk in chunks:
+            if first_chunk:
+                # Ook zonder hedging leren, zodat de drempels klaarstaan als hedging aangaat
+                hedge_stats.observe(stage, time.monotonic() - started)
+                first_chunk = False
+            # Het laatste chunk bevat alleen usage, zonder choices
+            if getattr(chunk, "usage", None):
+                usage = normalize_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].finish_reason == "length":
+                truncated = True
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                if record:
+                    timed_parts.append((time.monotonic(), chunk.choices[0].delta.content))
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        _report_error(e)
+        return
+    finally:
+        limiter.release()
+        if usage:
+            _record(stage, model, usage, started, limiter)
+        else:
+            limiter.charge(sum(len(p) for p in parts) // 4)
+    get_router().observe(tier, time.monotonic() - started)
+    if truncated:
+        get_token_profiles().truncated(stage)
+    # Alleen volledige antwoorden cachen
+    if key and parts and not truncated:
+        get_cache().set(key, "".join(parts), model=model)
+    if record and parts:
+        record[0].record(record[1], stage, model, timed_parts, started)
@@ -0,0 +1,113 @@
+import os
+import threading
+import weakref
+
+import httpx
+
+# Pool instellingen, overschrijfbaar via .env
+DEFAULT_BASE_URL = "https://api.deepseek.com/v1"
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE = 20
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+DEFAULT_TIMEOUT = 120.0
+
+
+class PoolStatsTransport(httpx.HTTPTransport):
+    """HTTP transport die bijhoudt hoeveel requests een bestaande verbinding hergebruiken"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._seen = weakref.WeakSet()
+        self.requests = 0
+        self.new_connections = 0
+
+    def _connections(self):
+        return list(getattr(self._pool, "connections", []))
+
+    def handle_request(self, request):
+        response = super().handle_request(request)
+        with self._stats_lock:
+            self.requests += 1
+            for conn in self._connections():
+                if conn not in self._seen:
+                    self._seen.add(conn)
+                    self.new_connections += 1
+        return response
+
+    def stats(self):
+        connections = self._connections()
+        with self._stats_lock:
+            requests = self.requests
+            new_connections = self.new_connections
+        reused = max(requests - new_connections, 0)
+        return {
+            "requests": requests,
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "new_connections": new_connections,
+            "reuse_ratio": reused / requests if requests else 0.0
+        }
+
+
+_client = None
+_transport = None
+_hedge_client = None
+_client_lock = threading.Lock()
+
+
+def _build_client(base_url=None, api_key=None):
+    # openai pas laden bij de eerste call: scheelt een halve seconde bij het opstarten
+    from openai import OpenAI
+
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("LLM_POOL_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)),
+        max_keepalive_connections=int(os.getenv("LLM_POOL_MAX_KEEPALIVE", DEFAULT_MAX_KEEPALIVE)),
+        keepalive_expiry=float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY))
+    )
+    transport = PoolStatsTransport(limits=limits, http2=False)
+    http_client = httpx.Client(
+        transport=transport,
+        timeout=float(os.getenv("LLM_TIMEOUT", DEFAULT_TIMEOUT))
+    )
+    client = OpenAI(
+        api_key=api_key or os.getenv("DEEPSEEK_API_KEY"),
+        base_url=base_url or os.getenv("LLM_BASE_URL", DEFAULT_BASE_URL),
+        http_client=http_client,
+        max_retries=0  # retries en backoff lopen via ratelimit.call_with_retry
+    )
+    return client, transport
+
+
+def get_client():
+    """Proces-brede OpenAI client met gedeelde connection pool.
+
+    Streamlit voert het script bij elke interactie opnieuw uit; deze module
+    blijft geladen, dus alle sessies en reruns hergebruiken dezelfde
+    keep-alive verbindingen.
+    """
+    global _client, _transport
+    with _client_lock:
+        if _client is None:
+            _client, _transport = _build_client()
+        return _client
+
+
+def get_hedge_client():
+    """Client voor hedge requests: LLM_HEDGE_BASE_URL als die is ingesteld, anders de gewone client"""
+    global _hedge_client
+    base_url = os.getenv("LLM_HEDGE_BASE_URL")
+    if not base_url:
+        return get_client()
+    with _client_lock:
+        if _hedge_client is None:
+            _hedge_client, _ = _build_client(base_url, os.getenv("LLM_HEDGE_API_KEY"))
+        return _hedge_client
+
+
+def pool_stats():
+    """Statistieken van de connection pool (leeg zolang er nog geen client is)"""
+    if _transport is None:
+        return {"requests": 0, "open_connections": 0, "idle_connections": 0,
+                "new_connections": 0, "reuse_ratio": 0.0}
+    return _transport.stats()
@@ -0,0 +1,191 @@
+import os
+import random
+import threading
+import time
+
+# Limieten, overschrijfbaar via .env (0 = geen limiet)
+DEFAULT_RPM = 0
+DEFAULT_TPM = 0
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+
+def estimate_tokens(messages):
+    """Grove schatting van het aantal prompt tokens (~4 tekens per token)"""
+    return sum(len(m.get("content") or "") for m in messages) // 4 + 4 * len(messages)
+
+
+class TokenBucket:
+    """Token bucket met een vulsnelheid per minuut; 0 betekent onbeperkt.
+
+    Het saldo mag negatief worden (achteraf verrekende tokens); nieuwe
+    aanvragen wachten dan tot de schuld is ingelopen.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        if not self.rate:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(min(wait, 1.0))
+
+    def charge(self, amount):
+        """Verreken tokens die pas na afloop van een call bekend zijn"""
+        if not self.rate:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+
+
+class AdaptiveLimiter:
+    """Gedeelde limiter voor requests/min, tokens/min en gelijktijdige calls.
+
+    De concurrency past zich aan volgens AIMD: bij throttling (429) wordt de
+    limiet gehalveerd, bij elke geslaagde call groeit hij langzaam terug tot
+    het maximum.
+    """
+
+    def __init__(self, rpm=0, tpm=0, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.requests = TokenBucket(rpm)
+        self.token_bucket = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+        self.retries = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, tokens=0):
+        with self._cond:
+            while self.in_flight >= max(int(self.limit), 1):
+                self._cond.wait()
+            self.in_flight += 1
+        try:
+            self.requests.acquire(1)
+            self.token_bucket.acquire(tokens)
+        except BaseException:
+            self.release()
+            raise
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def charge(self, tokens):
+        self.token_bucket.charge(tokens)
+
+    def on_success(self):
+        with self._cond:
+            self.limit = min(self.max_concurrency, self.limit + 1.0 / max(self.limit, 1.0))
+            self._cond.notify()
+
+    def on_throttle(self):
+        with self._cond:
+            self.throttled += 1
+            self.limit = max(1.0, self.limit / 2)
+
+    def on_retry(self):
+        with self._cond:
+            self.retries += 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "concurrency_limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "throttled": self.throttled,
+                "retries": self.retries
+            }
+
+
+def _status_code(e):
+    return getattr(e, "status_code", None)
+
+
+def is_retryable(e):
+    """429, 5xx, timeouts en verbindingsfouten zijn het opnieuw proberen waard"""
+    import openai  # is al geladen zodra er een call gedaan is
+
+    if isinstance(e, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    status = _status_code(e)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def _retry_after(e):
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, e=None):
+    """Exponentiële backoff met full jitter; Retry-After van de server gaat voor"""
+    retry_after = _retry_after(e) if e is not None else None
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_CAP)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def call_with_retry(fn, limiter, tokens=0, max_retries=None):
+    """Voer fn() uit binnen een limiter-slot, met retries op 429/5xx/timeouts.
+
+    Bij succes blijft het slot bezet (bijv. zolang een stream loopt); de
+    aanroeper moet daarna limiter.release() aanroepen.
+    """
+    if max_retries is None:
+        max_retries = int(os.getenv("LLM_MAX_RETRIES", DEFAULT_MAX_RETRIES))
+    for attempt in range(max_retries + 1):
+        limiter.acquire(tokens)
+        try:
+            result = fn()
+        except Exception as e:
+            limiter.release()
+            if not is_retryable(e) or attempt == max_retries:
+                raise
+            if _status_code(e) == 429:
+                limiter.on_throttle()
+            limiter.on_retry()
+            time.sleep(backoff_delay(attempt, e))
+            continue
+        limiter.on_success()
+        return result
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """Proces-brede limiter, gedeeld door alle sessies en batch workers"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AdaptiveLimiter(
+                rpm=int(os.getenv("LLM_RPM", DEFAULT_RPM)),
+                tpm=int(os.getenv("LLM_TPM", DEFAULT_TPM)),
+                max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+            )
+        return _limiter
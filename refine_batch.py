@@ -0,0 +1,157 @@
+"""Headless batch refinement van een complete backlog.
+
+Leest prompts uit een CSV (kolom "prompt", optioneel "id") of JSONL bestand,
+draait per item de keten teamlid_1 -> teamlid_2 -> teamlid_3_arbiter met
+begrensde parallelliteit en schrijft elk resultaat direct weg als rij in
+de Jira import CSV. Voortgang wordt in een checkpoint bestand bijgehouden,
+zodat een afgebroken run hervat kan worden.
+
+Gebruik:
+    python refine_batch.py backlog.csv -o jira_import.csv --workers 8
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+import semantic_cache
+from llm import set_options
+from team import refine, refine_snel, schat_story_points, parse_story_points, jira_story_data, jira_row, JIRA_COLUMNS
+
+
+def read_backlog(path):
+    """Lees (id, prompt) paren uit een CSV of JSONL bestand"""
+    items = []
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for idx, line in enumerate(f):
+                if line.strip():
+                    record = json.loads(line)
+                    items.append((str(record.get("id", idx)), record["prompt"]))
+    else:
+        with open(path, encoding="utf-8", newline="") as f:
+            for idx, row in enumerate(csv.DictReader(f)):
+                items.append((str(row.get("id") or idx), row["prompt"]))
+    return [(item_id, prompt) for item_id, prompt in items if prompt and prompt.strip()]
+
+
+def read_checkpoint(path):
+    """Geef de ids terug die in een eerdere run al verwerkt zijn"""
+    done = set()
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    done.add(json.loads(line)["id"])
+    return done
+
+
+class ResultWriter:
+    """Schrijft resultaten thread-safe en incrementeel naar CSV en checkpoint"""
+
+    def __init__(self, output_path, checkpoint_path):
+        new_file = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+        self._lock = threading.Lock()
+        self._csv_file = open(output_path, "a", encoding="utf-8", newline="")
+        self._writer = csv.DictWriter(self._csv_file, fieldnames=JIRA_COLUMNS)
+        if new_file:
+            self._writer.writeheader()
+        self._checkpoint = open(checkpoint_path, "a", encoding="utf-8")
+
+    def write(self, item_id, prompt, responses, points):
+        with self._lock:
+            self._writer.writerow(jira_row(jira_story_data(responses, points=points)))
+            self._csv_file.flush()
+            self._checkpoint.write(json.dumps(
+                {"id": item_id, "prompt": prompt, "responses": responses},
+                ensure_ascii=False
+            ) + "\n")
+            self._checkpoint.flush()
+
+    def close(self):
+        self._csv_file.close()
+        self._checkpoint.close()
+
+
+def process_item(item_id, prompt, story_points, semantic=None, fast=False):
+    match = semantic.lookup(prompt) if semantic else None
+    if match:
+        responses = match["responses"]
+    else:
+        responses = refine_snel(prompt) if fast else refine(prompt)
+        if responses is None:
+            return item_id, prompt, None, None
+        if semantic:
+            semantic.store(prompt, responses)
+    points = "3"
+    if story_points:
+        if not responses.get("story_points"):
+            responses["story_points"] = schat_story_points(responses["arbiter"]) or ""
+        points = parse_story_points(responses["story_points"])
+    return item_id, prompt, responses, points
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Refine een backlog zonder UI")
+    parser.add_argument("input", help="CSV (kolom 'prompt') of JSONL bestand met prompts")
+    parser.add_argument("-o", "--output", default="jira_import.csv", help="Jira import CSV")
+    parser.add_argument("--checkpoint", help="Checkpoint bestand (standaard <output>.checkpoint.jsonl)")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Aantal parallelle items")
+    parser.add_argument("--story-points", action="store_true", help="Schat ook story points per item")
+    parser.add_argument("--fast", action="store_true",
+                        help="Snelle refinement: één gestructureerde call per item in plaats van drie")
+    parser.add_argument("--no-cache", action="store_true", help="Sla de response cache over")
+    parser.add_argument("--semantic-cache", action="store_true",
+                        help="Hergebruik refinements van bijna gelijke prompts (chromadb + sentence-transformers)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    checkpoint_path = args.checkpoint or args.output + ".checkpoint.jsonl"
+    done = read_checkpoint(checkpoint_path)
+    todo = [(item_id, prompt) for item_id, prompt in read_backlog(args.input) if item_id not in done]
+    print(f"{len(done)} items al verwerkt, {len(todo)} te gaan", file=sys.stderr)
+
+    semantic = semantic_cache.get_semantic_cache() if args.semantic_cache else None
+    if args.semantic_cache and semantic is None:
+        print("chromadb/sentence-transformers niet geïnstalleerd; semantische cache uit", file=sys.stderr)
+
+    writer = ResultWriter(args.output, checkpoint_path)
+    failed = 0
+    start = time.time()
+
+    def run(item_id, prompt):
+        # Opties gelden per thread; elke worker zet ze zelf
+        set_options(use_cache=not args.no_cache, session_id="batch")
+        return process_item(item_id, prompt, args.story_points, semantic, args.fast)
+
+    pool = ThreadPoolExecutor(max_workers=max(args.workers, 1))
+    try:
+        futures = [pool.submit(run, item_id, prompt) for item_id, prompt in todo]
+        for count, future in enumerate(as_completed(futures), 1):
+            item_id, prompt, responses, points = future.result()
+            if responses is None:
+                failed += 1
+                print(f"[{count}/{len(todo)}] {item_id} mislukt", file=sys.stderr)
+                continue
+            writer.write(item_id, prompt, responses, points)
+            print(f"[{count}/{len(todo)}] {item_id} klaar ({time.time() - start:.0f}s)", file=sys.stderr)
+    except KeyboardInterrupt:
+        print("Afgebroken; hervat later met hetzelfde commando", file=sys.stderr)
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        pool.shutdown()
+        writer.close()
+
+    print(f"Klaar: {len(todo) - failed} verwerkt, {failed} mislukt", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
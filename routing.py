@@ -0,0 +1,119 @@
+"""Model tiering: elke stage krijgt een model via een tier uit een config bestand.
+
+Goedkope, classificatie-achtige stages (story points, risico's) gaan naar
+een snelle tier, de arbiter naar een sterke. Per tier wordt de latency
+bijgehouden; komt het p95 boven de SLO van de tier, dan wordt die tier een
+tijd lang overgeslagen ten gunste van zijn fallback tier.
+
+Config (MODEL_TIERS_PATH, standaard model_tiers.json):
+    {
+      "default_tier": "sterk",
+      "tiers": {
+        "snel": {"model": "deepseek-chat", "slo_ms": 15000, "fallback": "sterk"},
+        "sterk": {"model": "deepseek-chat", "slo_ms": 60000}
+      },
+      "stages": {"story_points": "snel", "arbiter": "sterk"}
+    }
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from token_profiles import percentile
+
+DEFAULT_PATH = "model_tiers.json"
+DEFAULT_WINDOW = 50  # laatste N calls per tier
+MIN_SAMPLES = 5  # pas na zoveel calls wordt de SLO gecontroleerd
+DEFAULT_COOLDOWN = 120.0  # seconden dat een tier na een SLO overschrijding wordt overgeslagen
+
+DEFAULT_CONFIG = {
+    "default_tier": "sterk",
+    "tiers": {
+        "snel": {"model": "deepseek-chat", "slo_ms": 15000, "fallback": "sterk"},
+        "sterk": {"model": "deepseek-chat", "slo_ms": 60000},
+    },
+    "stages": {},
+}
+
+
+class ModelRouter:
+    def __init__(self, config=None, cooldown=None):
+        if config is None:
+            path = os.getenv("MODEL_TIERS_PATH", DEFAULT_PATH)
+            config = DEFAULT_CONFIG
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    config = json.load(f)
+        self.tiers = config["tiers"]
+        self.stages = config.get("stages", {})
+        self.default_tier = config.get("default_tier")
+        self.cooldown = cooldown if cooldown is not None else float(
+            os.getenv("MODEL_TIER_COOLDOWN", DEFAULT_COOLDOWN)
+        )
+        self._lock = threading.Lock()
+        self._latencies = {tier: deque(maxlen=DEFAULT_WINDOW) for tier in self.tiers}
+        self._calls = {tier: 0 for tier in self.tiers}
+        self._degraded = {}  # tier -> tijdstip tot wanneer hij overgeslagen wordt
+        self.fallbacks = 0
+
+    def _available(self, tier):
+        return self._degraded.get(tier, 0) <= time.monotonic()
+
+    def route(self, stage, model):
+        """(model, tier) voor een call van `stage`; zonder tier blijft `model` staan"""
+        tier = self.stages.get(stage, self.default_tier)
+        if tier not in self.tiers:
+            return model, None
+        with self._lock:
+            seen = {tier}
+            while not self._available(tier):
+                fallback = self.tiers[tier].get("fallback")
+                if fallback not in self.tiers or fallback in seen:
+                    break
+                tier = fallback
+                seen.add(tier)
+            if len(seen) > 1:
+                self.fallbacks += 1
+        return self.tiers[tier]["model"], tier
+
+    def observe(self, tier, latency):
+        """Registreer de latency (s) van een geslaagde call; boven de SLO wordt de tier tijdelijk overgeslagen"""
+        if tier not in self.tiers:
+            return
+        with self._lock:
+            window = self._latencies[tier]
+            window.append(latency)
+            self._calls[tier] += 1
+            slo = self.tiers[tier].get("slo_ms")
+            if slo and len(window) >= MIN_SAMPLES and percentile(window, 95) * 1000 > slo:
+                self._degraded[tier] = time.monotonic() + self.cooldown
+                window.clear()  # na de cooldown telt alleen nieuw gedrag
+
+    def stats(self):
+        with self._lock:
+            return {
+                tier: {
+                    "model": config["model"],
+                    "slo_ms": config.get("slo_ms"),
+                    "fallback": config.get("fallback"),
+                    "calls": self._calls[tier],
+                    "p50_ms": int(percentile(self._latencies[tier], 50) * 1000),
+                    "p95_ms": int(percentile(self._latencies[tier], 95) * 1000),
+                    "degraded": not self._available(tier),
+                }
+                for tier, config in self.tiers.items()
+            }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+        return _router
@@ -0,0 +1,96 @@
+"""User stories als adresseerbare secties, met patches per sectie.
+
+Een story wordt opgesplitst op Markdown koppen (of vetgedrukte/genummerde
+kopregels zoals de arbiter ze schrijft). Een verfijning stuurt de story met
+sectie-ids mee en krijgt alleen de gewijzigde secties terug:
+
+    @@ S3
+    <nieuwe inhoud van sectie S3, inclusief kop>
+    @@ NA S3
+    <nieuwe sectie, ingevoegd na S3>
+    @@ WEG S4
+
+De patch wordt lokaal samengevoegd; de rest van de story blijft letterlijk staan.
+"""
+import re
+
+_KOP = re.compile(r"^(#{1,6}\s+\S.*|\*\*[^*].*\*\*:?\s*|\d+\.\s+\*\*.+)$")
+_PATCH = re.compile(r"^@@\s*(NA\s+|WEG\s+)?(S\d+)\s*$", re.IGNORECASE)
+
+
+def split_sections(text):
+    """Lijst van secties {"id", "titel", "tekst"}; tekst vóór de eerste kop is sectie S0"""
+    sections = []
+    current = {"id": "S0", "titel": "", "regels": []}
+    in_code = False
+    for line in (text or "").splitlines():
+        if line.lstrip().startswith("```"):
+            in_code = not in_code
+        if not in_code and _KOP.match(line.strip()) and (current["regels"] or current["titel"]):
+            sections.append(current)
+            current = {"id": f"S{len(sections)}", "titel": "", "regels": []}
+        if not current["regels"] and _KOP.match(line.strip()):
+            current["titel"] = line.strip().replace("**", "").strip("# ").rstrip(":")
+        current["regels"].append(line)
+    sections.append(current)
+    result = []
+    for section in sections:
+        tekst = "\n".join(section["regels"]).strip("\n")
+        if tekst.strip():
+            result.append({"id": section["id"], "titel": section["titel"] or tekst.strip().splitlines()[0][:60],
+                           "tekst": tekst})
+    return result
+
+
+def join_sections(sections):
+    return "\n\n".join(section["tekst"] for section in sections)
+
+
+def annotate(sections):
+    """Story met sectie-markers, zoals het model hem te zien krijgt"""
+    return "\n\n".join(f"[{section['id']}]\n{section['tekst']}" for section in sections)
+
+
+def parse_patch(text):
+    """Patch operaties: (actie, sectie id, tekst) met actie "vervang", "na" of "weg" """
+    ops = []
+    current = None
+    for line in (text or "").splitlines():
+        match = _PATCH.match(line.strip())
+        if match:
+            if current:
+                ops.append(current)
+            actie = (match.group(1) or "").strip().lower() or "vervang"
+            current = [actie, match.group(2).upper(), []]
+            continue
+        if current is not None:
+            current[2].append(line)
+    if current:
+        ops.append(current)
+    return [(actie, section_id, "\n".join(regels).strip("\n")) for actie, section_id, regels in ops]
+
+
+def apply_patch(sections, ops):
+    """Pas patch operaties toe: (nieuwe secties, ids van gewijzigde secties)"""
+    result = [dict(section) for section in sections]
+    changed = []
+    for actie, section_id, tekst in ops:
+        index = next((i for i, s in enumerate(result) if s["id"] == section_id), None)
+        if index is None:
+            continue  # onbekende sectie: negeren in plaats van gokken
+        if actie == "weg":
+            del result[index]
+        elif actie == "na" and tekst:
+            result.insert(index + 1, {"id": f"{section_id}+{len(changed)}", "titel": "", "tekst": tekst})
+        elif actie == "vervang" and tekst:
+            result[index]["tekst"] = tekst
+        else:
+            continue
+        changed.append(section_id)
+    return result, changed
+
+
+def merge_patch(story, patch):
+    """Voeg een patch samen met een story: (nieuwe story, gewijzigde sectie-ids)"""
+    sections, changed = apply_patch(split_sections(story), parse_patch(patch))
+    return join_sections(sections), changed
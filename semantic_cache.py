@@ -0,0 +1,123 @@
+import hashlib
+import importlib.util
+import json
+import os
+import threading
+import time
+
+# Instellingen, overschrijfbaar via .env
+DEFAULT_PATH = os.path.join(".cache", "chroma")
+DEFAULT_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+DEFAULT_THRESHOLD = 0.92
+COLLECTION = "refinements"
+
+# Alleen deze velden worden hergebruikt; afgeleide artefacten worden opnieuw berekend
+CACHED_FIELDS = ("teamlid1", "teamlid2", "arbiter")
+
+
+def is_available():
+    """True als chromadb en sentence-transformers geïnstalleerd zijn"""
+    return all(importlib.util.find_spec(m) is not None for m in ("chromadb", "sentence_transformers"))
+
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(model_name=None):
+    """Proces-breed gedeeld embedding model (semantische cache en docs index)"""
+    model_name = model_name or os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL)
+    with _encoders_lock:
+        if model_name not in _encoders:
+            from sentence_transformers import SentenceTransformer
+            _encoders[model_name] = SentenceTransformer(model_name)
+        return _encoders[model_name]
+
+
+class SemanticCache:
+    """Semantische cache van complete refinements in een persistente Chroma collectie.
+
+    Prompts worden ge-embed met sentence-transformers; een nieuwe prompt die
+    boven de drempel (cosine similarity) lijkt op een eerdere prompt krijgt
+    de eerdere refinement aangeboden.
+    """
+
+    def __init__(self, path=None, model_name=None, threshold=None):
+        # Zware imports pas laden als de cache echt gebruikt wordt
+        import chromadb
+
+        self.threshold = threshold if threshold is not None else float(
+            os.getenv("SEMANTIC_CACHE_THRESHOLD", DEFAULT_THRESHOLD)
+        )
+        self._model = get_encoder(model_name)
+        client = chromadb.PersistentClient(path=path or os.getenv("SEMANTIC_CACHE_PATH", DEFAULT_PATH))
+        self._collection = client.get_or_create_collection(
+            COLLECTION, metadata={"hnsw:space": "cosine"}
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _embed(self, text):
+        return self._model.encode([text], normalize_embeddings=True).tolist()
+
+    def lookup(self, prompt, threshold=None):
+        """Zoek de meest gelijkende eerdere refinement.
+
+        Geeft een dict met "prompt", "responses" en "similarity" terug, of
+        None als niets boven de drempel uitkomt.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        with self._lock:
+            if self._collection.count() == 0:
+                self.misses += 1
+                return None
+            result = self._collection.query(
+                query_embeddings=self._embed(prompt),
+                n_results=1,
+                include=["documents", "metadatas", "distances"]
+            )
+        if not result["ids"][0]:
+            self.misses += 1
+            return None
+        similarity = 1.0 - result["distances"][0][0]
+        if similarity < threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {
+            "prompt": result["documents"][0][0],
+            "responses": json.loads(result["metadatas"][0][0]["responses"]),
+            "similarity": similarity
+        }
+
+    def store(self, prompt, responses):
+        """Sla een voltooide refinement op onder zijn prompt"""
+        cached = {field: responses.get(field, "") for field in CACHED_FIELDS}
+        if not all(cached.values()):
+            return
+        with self._lock:
+            self._collection.upsert(
+                ids=[hashlib.sha256(prompt.encode("utf-8")).hexdigest()],
+                embeddings=self._embed(prompt),
+                documents=[prompt],
+                metadatas=[{"responses": json.dumps(cached, ensure_ascii=False), "created": time.time()}]
+            )
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": self._collection.count()}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    """Proces-brede semantische cache, of None als de dependencies ontbreken"""
+    global _cache
+    if not is_available():
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticCache()
+        return _cache
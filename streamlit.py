@@ -1,154 +1,41 @@
 import streamlit as st
 import os
-import graphviz
-from openai import OpenAI
 from dotenv import load_dotenv
 import datetime
+import uuid
 import json
-import pandas as pd
-from io import StringIO
-
-# Laden van API sleutel
-load_dotenv()
-client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com/v1"
+import hashlib
+import tempfile
+import time
+from functools import partial
+from llm_cache import get_cache
+from llm_client import pool_stats
+from llm import set_options
+from ratelimit import get_limiter
+from usage import get_usage_stats
+from ledger import get_ledger
+from token_profiles import get_token_profiles
+from routing import get_router
+from hedge import get_hedge_stats
+import semantic_cache
+import docs_index
+from history_store import get_history_store
+from history_export import write_export, story_markdown, FORMATS as EXPORT_FORMATS
+from team import (
+    teamlid_1, teamlid_2, teamlid_3_arbiter, chat_with_teamlid, verfijn_user_story,
+    jira_story_data, generate_jira_import, snelle_refinement, parse_snelle_refinement,
+    SNELLE_SECTIES, vat_gesprek_samen, verfijn_secties, condenseer_input,
+    documentatie
 )
+import condense
+import chat_context
+from jobs import get_job_manager, DONE, FAILED
+from artifacts import GRAPH, huidige_story
+from sections import merge_patch
+from task_graph import parse_taken, diagrammen, get_svg_cache
 
-# --- Verbeterde Teamlid Functies ---
-def generate_response(model, messages, max_tokens=5000):
-    """Gecentraliseerde functie voor API calls met error handling"""
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=0.7  # Meer creativiteit toestaan
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        st.error(f"API Fout: {str(e)}")
-        return None
-
-def teamlid_1(prompt):
-    messages = [
-        {"role": "system", "content": "Je bent een ervaren product owner. Schrijf duidelijke user stories volgens INVEST criteria."},
-        {"role": "user", "content": f"""Schrijf een user story gebaseerd op:
-        {prompt}
-        
-        Volg dit format:
-        Als een [type gebruiker]
-        Wil ik [doel/wens]
-        Zodat [waarde/business doel]
-        
-        Acceptatiecriteria:
-        - [Meetbaar criterium 1]
-        - [Meetbaar criterium 2]"""}
-    ]
-    return generate_response("deepseek-chat", messages)
-
-def teamlid_2(prompt, teamlid1_output):
-    messages = [
-        {"role": "system", "content": "Je bent een senior developer. Geef technische feedback en verbeter user stories."},
-        {"role": "user", "content": f"""Geef technische feedback op deze user story:
-        Originele prompt: {prompt}
-        
-        User story:
-        {teamlid1_output}
-        
-        Richtlijnen:
-        1. Identificeer ontbrekende technische vereisten
-        2. Controleer op ambiguïteit
-        3. Voeg implementatie details toe waar nodig
-        4. Behoud de business waarde"""}
-    ]
-    return generate_response("deepseek-chat", messages)
-
-def teamlid_3_arbiter(prompt, teamlid1_output, teamlid2_output):
-    messages = [
-        {"role": "system", "content": "Je bent een QA engineer. Evalueer user stories en voeg testscenario's toe."},
-        {"role": "user", "content": f"""Evalueer deze user story versies:
-        Originele prompt: {prompt}
-        
-        Product Owner versie:
-        {teamlid1_output}
-        
-        Developer feedback:
-        {teamlid2_output}
-        
-        Geef:
-        1. Een samengevoegde, verbeterde versie
-        2. Testscenario's (happy path + edge cases)
-        3. Kwaliteitsscore (1-10) met motivatie
-        4. Risicoanalyse"""}
-    ]
-    return generate_response("deepseek-chat", messages)
-
-def split_story(final_story):
-    messages = [
-        {"role": "system", "content": "Je bent een agile coach. Splits user stories in kleine, uitvoerbare taken."},
-        {"role": "user", "content": f"""Splits deze user story:
-        {final_story}
-        
-        Volg dit format:
-        ## Epics
-        - [Epic 1]
-        - [Epic 2]
-        
-        ## User Stories
-        - [US 1]
-        - [US 2]
-        
-        ## Technische Taken
-        - [Taak 1]
-        - [Taak 2]"""}
-    ]
-    return generate_response("deepseek-chat", messages)
-
-def chat_with_teamlid(role, vraag):
-    instructies = {
-        "Product Owner": "Je bent een product owner. Beantwoord vragen vanuit business perspectief.",
-        "Senior Developer": "Je bent een senior developer. Beantwoord vanuit technisch perspectief.",
-        "Tester": "Je bent een QA engineer. Richt je op testbaarheid en kwaliteit."
-    }
-    messages = [
-        {"role": "system", "content": instructies.get(role, f"Je bent een {role}")},
-        {"role": "user", "content": vraag}
-    ]
-    return generate_response("deepseek-chat", messages)
-
-def verfijn_user_story(final_story, verfijnings_prompt):
-    messages = [
-        {"role": "system", "content": "Je bent een agile coach. Verfijn user stories op basis van feedback."},
-        {"role": "user", "content": f"""Verfijn deze user story:
-        {final_story}
-        
-        Verfijningsinstructies:
-        {verfijnings_prompt}
-        
-        Behoud het INVEST format:
-        - Independent
-        - Negotiable
-        - Valuable
-        - Estimable
-        - Small
-        - Testable"""}
-    ]
-    return generate_response("deepseek-chat", messages)
-
-def generate_jira_import(story_data):
-    """Genereer CSV voor Jira import"""
-    data = {
-        "Summary": [story_data["title"]],
-        "Description": [story_data["description"]],
-        "Acceptance Criteria": [story_data["acceptance"]],
-        "Story Points": [story_data["points"]],
-        "Component": ["Backend"],
-        "Labels": ["generated"]
-    }
-    return pd.DataFrame(data)
-
-
+# Laden van API sleutel; de client (en connection pool) wordt gedeeld over reruns
+load_dotenv()
 
 # --- UI Configuratie ---
 st.set_page_config(page_title="AI Scrum Tool PRO", layout="wide", initial_sidebar_state="expanded")
@@ -157,21 +44,303 @@ st.title("🚀 AI Scrum Team Assistent PRO")
 # --- Session State Management ---
 class SessionState:
     def __init__(self):
-        self.history = []
+        self.session_id = uuid.uuid4().hex
+        self.history_id = None  # id van de huidige story in de history store
+        self.history_saved = {}
+        self.history_page = 0
         self.current_responses = {
             "teamlid1": "", "teamlid2": "", "arbiter": "",
             "subtaken": "", "acceptatie": "", "verfijnd": "",
             "story_points": "", "risico_analyse": ""
         }
         self.chat_history = []
+        self.chat_pending = None  # ingediende chatvraag waarvan het antwoord nog loopt
+        self.chat_queue = []  # vragen die wachten tot het lopende antwoord klaar is
+        self.chat_failed = []  # vragen waarvan het antwoord mislukte, met de fout
+        self.chat_contexts = {}  # rol -> samenvatting + recente beurten (zie chat_context)
         self.settings = {
             "ai_temperature": 0.7,
-            "max_tokens": 5000
+            "max_tokens": 8000,
+            "streaming": True,
+            "fast_mode": False,
+            "precompute": True,
+            "chat_context_tokens": int(os.getenv("CHAT_CONTEXT_TOKENS", chat_context.DEFAULT_BUDGET)),
+            "use_cache": True,
+            "hedge": os.getenv("LLM_HEDGE", "0") == "1",
+            "semantic_cache": semantic_cache.is_available(),
+            "semantic_threshold": semantic_cache.DEFAULT_THRESHOLD,
+            "use_docs": semantic_cache.is_available() and os.getenv("DOCS_RETRIEVAL", "1") == "1"
         }
+        self.semantic_match = None
+        self.jobs = {}  # artefact -> {"job_id", "inputs"} van lopende achtergrondjobs
+        self.artifact_inputs = {}  # artefact -> fingerprint van de inputs waarmee het berekend is
+        self.artifact_failed = {}  # artefact -> fingerprint van de inputs waarmee het mislukte
 
 if "app_state" not in st.session_state:
     st.session_state.app_state = SessionState()
 
+def zet_llm_opties():
+    """Call-opties van deze sessie; elke rerun draait in een nieuwe thread met een lege context"""
+    settings = st.session_state.app_state.settings
+    set_options(
+        on_error=st.error,
+        use_cache=settings["use_cache"],
+        use_docs=settings["use_docs"],
+        max_tokens=settings["max_tokens"],
+        hedge=settings["hedge"],
+        session_id=st.session_state.app_state.session_id
+    )
+
+# Vóór het plannen van jobs: die nemen de opties van deze thread over
+zet_llm_opties()
+
+def voer_uit(stage_fn, *args, toon=True):
+    """Roep een teamlid-functie aan; in streaming modus verschijnen tokens direct.
+
+    Geeft altijd de volledige tekst terug (of None bij een fout), zodat
+    history en export ongewijzigd blijven werken.
+    """
+    if st.session_state.app_state.settings.get("streaming", True):
+        return st.write_stream(stage_fn(*args, stream=True)) or None
+    result = stage_fn(*args)
+    if toon and result:
+        st.markdown(result)
+    return result
+
+def start_job(artifact, fn, *args, inputs=None):
+    """Bereken een afgeleid artefact op de achtergrond; `inputs` is de fingerprint van de inputs"""
+    app_state = st.session_state.app_state
+    job_id = get_job_manager().submit(fn, *args, label=artifact, owner=app_state.session_id)
+    app_state.jobs[artifact] = {"job_id": job_id, "inputs": inputs}
+
+def bereken_artefact(artifact, force=False):
+    """Start de berekening van één artefact met de actuele inputs (tenzij die al loopt).
+
+    Is de berekening met deze inputs al eens mislukt, dan alleen met `force`
+    (de gebruiker klikt expliciet op de actie).
+    """
+    app_state = st.session_state.app_state
+    fingerprint = GRAPH.fingerprint(app_state.current_responses, artifact)
+    running = app_state.jobs.get(artifact)
+    if fingerprint is None or (running and running["inputs"] == fingerprint):
+        return
+    if app_state.artifact_failed.get(artifact) == fingerprint:
+        if not force:
+            return
+        del app_state.artifact_failed[artifact]
+    start_job(artifact, GRAPH.artifacts[artifact].compute,
+              *GRAPH.args(app_state.current_responses, artifact), inputs=fingerprint)
+
+def verwerk_jobs():
+    """Neem resultaten van afgeronde jobs over, als hun inputs nog actueel zijn"""
+    app_state = st.session_state.app_state
+    for artifact, info in list(app_state.jobs.items()):
+        job = get_job_manager().get(info["job_id"])
+        if job is not None and not job.done:
+            continue
+        del app_state.jobs[artifact]
+        if job is None or info["inputs"] != GRAPH.fingerprint(app_state.current_responses, artifact):
+            continue
+        if job.status == DONE:
+            app_state.current_responses[artifact] = job.result
+            app_state.artifact_inputs[artifact] = info["inputs"]
+            app_state.artifact_failed.pop(artifact, None)
+        else:
+            # Niet automatisch opnieuw proberen met dezelfde inputs (budget, 4xx, aanhoudende 5xx)
+            app_state.artifact_failed[artifact] = info["inputs"]
+            if job.error:
+                st.error(job.error)
+
+def bijwerken_artefacten():
+    """Maak verouderde artefacten ongeldig en bereken ontbrekende vooruit"""
+    app_state = st.session_state.app_state
+    GRAPH.invalidate(app_state.current_responses, app_state.artifact_inputs)
+    if app_state.settings["precompute"]:
+        running = {name: info["inputs"] for name, info in app_state.jobs.items()}
+        for name, fn, args, fingerprint in GRAPH.plan(app_state.current_responses, running,
+                                                      app_state.artifact_failed):
+            start_job(name, fn, *args, inputs=fingerprint)
+
+def nieuwe_story(responses):
+    """Maak `responses` de huidige story; aanwezige artefacten gelden als actueel"""
+    app_state = st.session_state.app_state
+    app_state.current_responses = responses
+    app_state.artifact_inputs = {}
+    app_state.artifact_failed = {}
+    GRAPH.mark_fresh(responses, app_state.artifact_inputs)
+
+@st.fragment(run_every=1.0)
+def toon_job(job_id):
+    """Toon de voortgang van een lopende job; ververst zichzelf tot de job klaar is"""
+    job = get_job_manager().get(job_id)
+    if job is None or job.done:
+        st.rerun()
+    st.caption("⏳ Wordt op de achtergrond berekend, je kunt verder werken...")
+    if job.partial:
+        st.markdown(job.partial)
+
+def toon_artifact(artifact, render=st.markdown):
+    """Toon een afgeleid artefact, of de voortgang als het nog berekend wordt"""
+    if artifact in st.session_state.app_state.jobs:
+        toon_job(st.session_state.app_state.jobs[artifact]["job_id"])
+    elif st.session_state.app_state.current_responses.get(artifact):
+        render(st.session_state.app_state.current_responses[artifact])
+
+def toon_taakgraaf(tekst):
+    """Takenstructuur als diagram per epic; ongewijzigde diagrammen komen uit de SVG cache"""
+    knopen = parse_taken(tekst)
+    if not knopen:
+        st.caption("Geen takenstructuur gevonden in de opgesplitste taken")
+        return
+    for epic, titel, aantal, dot in diagrammen(knopen):
+        with st.expander(f"{epic} · {titel} ({aantal} items)", expanded=aantal <= 25):
+            svg = get_svg_cache().svg(dot)
+            if svg:
+                st.image(svg, use_container_width=True)
+            else:
+                st.graphviz_chart(dot)  # geen dot binary: layout in de browser
+
+def voeg_chatbeurt_toe(role, question, answer, budget):
+    """Voeg een beurt toe aan de context van `role` en vat oudere beurten samen als het budget op is"""
+    app_state = st.session_state.app_state
+    context = app_state.chat_contexts.setdefault(role, chat_context.new_context())
+    context["turns"].append({"question": question, "answer": answer})
+    if chat_context.needs_compaction(context, budget):
+        fold = chat_context.turns_to_fold(context)
+        job_id = get_job_manager().submit(
+            vat_gesprek_samen, context["summary"], list(fold),
+            label="chat_samenvatting", owner=app_state.session_id
+        )
+        context["compacting"] = {"job_id": job_id, "folded": len(fold)}
+
+def verwerk_chat_samenvattingen():
+    """Verwerk afgeronde samenvattingsjobs in de chatcontexten"""
+    for context in st.session_state.app_state.chat_contexts.values():
+        compacting = context["compacting"]
+        if not compacting:
+            continue
+        job = get_job_manager().get(compacting["job_id"])
+        if job is None or (job.done and not job.result):
+            context["compacting"] = None  # volgende beurt probeert het opnieuw
+        elif job.done:
+            chat_context.apply_summary(context, job.result, compacting["folded"])
+
+def start_chatvraag(budget):
+    """Start de volgende vraag uit de wachtrij als er geen antwoord meer loopt"""
+    app_state = st.session_state.app_state
+    if app_state.chat_pending is not None or not app_state.chat_queue:
+        return
+    vraag = app_state.chat_queue.pop(0)
+    context = app_state.chat_contexts.setdefault(vraag["role"], chat_context.new_context())
+    snapshot = {"summary": context["summary"], "turns": list(context["turns"])}
+    # Single-flight op (rol, vraag, context): identieke vragen in dezelfde
+    # gesprekstoestand (ook uit andere sessies) delen één call
+    fingerprint = hashlib.sha256(json.dumps(snapshot, sort_keys=True).encode("utf-8")).hexdigest()
+    job_id = get_job_manager().submit(
+        chat_with_teamlid, vraag["role"], vraag["question"], snapshot, budget,
+        label="chat", owner=app_state.session_id,
+        key=("chat", vraag["role"], vraag["question"].strip(), fingerprint)
+    )
+    app_state.chat_pending = {**vraag, "job_id": job_id}
+
+def zoek_semantisch(prompt):
+    """Zoek een eerdere refinement met een bijna gelijke prompt (of None)"""
+    settings = st.session_state.app_state.settings
+    if not settings["semantic_cache"]:
+        return None
+    try:
+        with st.spinner("Zoeken naar vergelijkbare refinements..."):
+            return semantic_cache.get_semantic_cache().lookup(prompt, settings["semantic_threshold"])
+    except Exception as e:
+        st.warning(f"Semantische cache niet beschikbaar: {str(e)}")
+        return None
+
+def bewaar_semantisch(prompt, responses):
+    try:
+        semantic_cache.get_semantic_cache().store(prompt, responses)
+    except Exception as e:
+        st.warning(f"Opslaan in semantische cache mislukt: {str(e)}")
+
+def laad_refinement(prompt, cached_responses):
+    """Neem een refinement uit de semantische cache over als huidige story"""
+    responses = {key: "" for key in st.session_state.app_state.current_responses}
+    responses.update(cached_responses)
+    nieuwe_story(responses)
+    voeg_toe_aan_geschiedenis(prompt, responses)
+
+def voeg_toe_aan_geschiedenis(prompt, responses):
+    st.session_state.app_state.history_id = get_history_store().add(prompt, responses)
+    st.session_state.app_state.history_saved = responses.copy()
+
+def bewaar_geschiedenis():
+    """Schrijf wijzigingen (verfijning, taken, ...) van de huidige story terug"""
+    app_state = st.session_state.app_state
+    if app_state.history_id and app_state.current_responses != app_state.history_saved:
+        get_history_store().update(app_state.history_id, app_state.current_responses)
+        app_state.history_saved = app_state.current_responses.copy()
+
+def start_refinement(invoer):
+    """Draai de keten teamlid_1 -> teamlid_2 -> arbiter met voortgang in een st.status blok.
+
+    Lange invoer wordt eerst tot een brief samengevat; de geschiedenis bewaart de originele invoer.
+    """
+    with st.status("🔍 AI Team aan het werk...", expanded=True) as status:
+        responses = st.session_state.app_state.current_responses
+        prompt = invoer
+        if condense.needs_condensing(invoer):
+            st.write(f"📚 Lange invoer samenvatten ({len(condense.chunk_text(invoer))} delen)...")
+            prompt = condenseer_input(invoer) or ""
+            if prompt:
+                st.caption(f"Brief van ~{condense.tokens(prompt)} tokens in plaats van ~{condense.tokens(invoer)}")
+                with st.expander("Brief"):
+                    st.markdown(prompt)
+        stappen = [
+            ("Product Owner schrijft user story...", "teamlid1",
+             lambda: voer_uit(teamlid_1, prompt, toon=False)),
+            ("Developer geeft feedback...", "teamlid2",
+             lambda: voer_uit(partial(teamlid_2, docs=docs), prompt, responses["teamlid1"], toon=False)),
+            ("Tester evalueert...", "arbiter",
+             lambda: voer_uit(partial(teamlid_3_arbiter, docs=docs), prompt, responses["teamlid1"],
+                              responses["teamlid2"], toon=False)),
+        ]
+        # Nieuwe story: alle afgeleide artefacten van de vorige vervallen
+        for key in [key for _, key, _ in stappen] + list(GRAPH.artifacts):
+            responses[key] = ""
+        st.session_state.app_state.artifact_inputs = {}
+        st.session_state.app_state.artifact_failed = {}
+        # Zonder prompt (samenvatten mislukt) meldt de status hieronder de fout
+        if prompt and st.session_state.app_state.settings["fast_mode"]:
+            # Eén gestructureerde call, daarna terug verdeeld over de bekende keys
+            st.write("⚡ Team verfijnt in één call...")
+            snel = parse_snelle_refinement(voer_uit(snelle_refinement, prompt, toon=False)) or {}
+            for key in SNELLE_SECTIES.values():
+                responses[key] = snel.get(key, "")
+            GRAPH.mark_fresh(responses, st.session_state.app_state.artifact_inputs, ["story_points"])
+        elif prompt:
+            # Eén retrieval per refinement, gedeeld door teamlid 2 en de arbiter
+            docs = documentatie(prompt)
+            # Stop de keten bij de eerste mislukte stap in plaats van None door te geven
+            for label, key, stap in stappen:
+                st.write(label)
+                responses[key] = stap() or ""
+                if not responses[key]:
+                    break
+
+        if responses["arbiter"]:
+            # Update history
+            voeg_toe_aan_geschiedenis(invoer, responses)
+
+            if st.session_state.app_state.settings["semantic_cache"]:
+                bewaar_semantisch(invoer, responses)
+            bijwerken_artefacten()
+            status.update(label="✅ Refinement voltooid!", state="complete", expanded=False)
+            st.balloons()
+        else:
+            status.update(label="❌ Refinement mislukt, probeer het opnieuw", state="error")
+
+verwerk_jobs()
+bijwerken_artefacten()
+
 # --- Sidebar met Geschiedenis en Instellingen ---
 with st.sidebar:
     st.header("⚙️ Instellingen")
@@ -179,30 +348,205 @@ with st.sidebar:
         "AI Creativiteit", 0.0, 1.0, 0.7, 0.1,
         help="Hoger = creatiever, Lager = voorspelbaarder"
     )
+    st.session_state.app_state.settings["max_tokens"] = st.number_input(
+        "Max tokens (plafond)", 256, 8000, 8000, 256,
+        help="Bovengrens per call; binnen dit plafond krijgt elke stage een eigen limiet (zie 📏 Token limieten)"
+    )
+    st.session_state.app_state.settings["streaming"] = st.toggle(
+        "Streaming weergave", value=True,
+        help="Toon tokens direct tijdens het genereren"
+    )
+    st.session_state.app_state.settings["fast_mode"] = st.toggle(
+        "⚡ Snelle refinement", value=False,
+        help="Product owner, developer, tester en story points in één call (sneller, minder deliberatie)"
+    )
+    st.session_state.app_state.settings["precompute"] = st.toggle(
+        "Vooruit berekenen", value=True,
+        help="Bereken story points, risico's, taken en acceptatiecriteria zodra de story klaar is"
+    )
+    st.session_state.app_state.settings["chat_context_tokens"] = st.number_input(
+        "Chat context (tokens)", 500, 16000, st.session_state.app_state.settings["chat_context_tokens"], 500,
+        help="Budget voor eerdere chatbeurten; oudere beurten worden samengevat"
+    )
+    st.session_state.app_state.settings["use_cache"] = st.toggle(
+        "Response cache", value=True,
+        help="Beantwoord identieke aanvragen uit de cache in plaats van de API"
+    )
+    st.session_state.app_state.settings["hedge"] = st.toggle(
+        "Hedged requests", value=st.session_state.app_state.settings["hedge"],
+        help="Start een tweede request als het eerste token langer uitblijft dan gebruikelijk (p95)"
+    )
+    st.session_state.app_state.settings["semantic_cache"] = st.toggle(
+        "Semantische cache", value=semantic_cache.is_available(),
+        disabled=not semantic_cache.is_available(),
+        help="Bied een eerdere refinement aan als de prompt er sterk op lijkt"
+    )
+    if st.session_state.app_state.settings["semantic_cache"]:
+        st.session_state.app_state.settings["semantic_threshold"] = st.slider(
+            "Gelijkenis drempel", 0.80, 1.0, semantic_cache.DEFAULT_THRESHOLD, 0.01
+        )
+    st.session_state.app_state.settings["use_docs"] = st.toggle(
+        "Projectdocumentatie gebruiken", value=st.session_state.app_state.settings["use_docs"],
+        disabled=not semantic_cache.is_available(),
+        help="Geef teamlid 2 en de arbiter de meest relevante stukken uit de docs index mee"
+    )
+    zet_llm_opties()  # met de zojuist gekozen instellingen
+
+    with st.expander("💰 Verbruik & budget"):
+        ledger = get_ledger()
+        sessie_kosten = ledger.session_cost(st.session_state.app_state.session_id)
+        dag_kosten = ledger.daily_cost()
+        cols = st.columns(2)
+        cols[0].metric("Deze sessie", f"${sessie_kosten:.4f}")
+        cols[1].metric("Vandaag (totaal)", f"${dag_kosten:.4f}")
+        if ledger.session_budget:
+            st.progress(min(sessie_kosten / ledger.session_budget, 1.0),
+                        text=f"Sessiebudget ${ledger.session_budget:.2f}")
+        if ledger.daily_budget:
+            st.progress(min(dag_kosten / ledger.daily_budget, 1.0),
+                        text=f"Dagbudget ${ledger.daily_budget:.2f}")
+        if ledger.check_budget(st.session_state.app_state.session_id):
+            st.warning(f"Budget overschreden: calls worden {'afgeschaald' if ledger.action == 'downgrade' else 'geweigerd'}")
+        for rij in ledger.stage_summary():
+            st.caption(
+                f"**{rij['stage']}**: {rij['calls']} calls, {rij['prompt_tokens']}+{rij['completion_tokens']} tokens, "
+                f"{rij['avg_latency_ms']} ms gem., ${rij['cost']:.4f}"
+            )
+    cache_stats = get_cache().stats()
+    cols = st.columns(3)
+    cols[0].metric("Cache hits", cache_stats["hits"])
+    cols[1].metric("Misses", cache_stats["misses"])
+    cols[2].metric("Hit rate", f"{cache_stats['hit_rate']:.0%}")
+    st.caption(f"{cache_stats['entries']} entries, {cache_stats['bytes'] / 1024:.0f} KB")
+    if st.button("🗑️ Cache legen"):
+        get_cache().clear()
+        st.rerun()
+
+    with st.expander("📏 Token limieten"):
+        st.caption("max_tokens per stage: vast (TOKEN_PROFILES), geleerd (p99 van eerdere outputs + marge) of die van de aanroep")
+        for rij in get_token_profiles().summary(st.session_state.app_state.settings["max_tokens"]):
+            bron = ("vast" if rij["fixed"] is not None
+                    else f"geleerd, p99 {rij['p99']} over {rij['samples']} calls" if rij["learned"]
+                    else f"nog niet geleerd, {rij['samples']} calls")
+            afgekapt = f", {rij['truncated']}x afgekapt" if rij["truncated"] else ""
+            st.caption(f"**{rij['stage']}**: {rij['limit']} tokens ({bron}{afgekapt})")
+
+    with st.expander("🧭 Model routing"):
+        router = get_router()
+        for tier, rij in router.stats().items():
+            status = "⚠️ boven SLO, fallback actief" if rij["degraded"] else "✅"
+            st.caption(
+                f"**{tier}** ({rij['model']}) {status}: {rij['calls']} calls, "
+                f"p50 {rij['p50_ms']} ms, p95 {rij['p95_ms']} ms (SLO {rij['slo_ms']} ms)"
+            )
+        st.caption(f"{router.fallbacks} calls omgeleid naar een fallback tier")
+
+    if semantic_cache.is_available():
+        with st.expander("📚 Documentatie index"):
+            if st.button("🔄 Index bijwerken"):
+                with st.spinner("Gewijzigde documenten indexeren..."):
+                    bijgewerkt = docs_index.get_docs_index().update()
+                st.caption(f"{bijgewerkt['indexed']} bestanden geïndexeerd ({bijgewerkt['chunks']} stukken), "
+                           f"{bijgewerkt['unchanged']} ongewijzigd, {bijgewerkt['removed']} verwijderd")
+            index_stats = docs_index.summary()
+            cols = st.columns(2)
+            cols[0].metric("Bestanden", index_stats["files"])
+            cols[1].metric("Stukken", index_stats["chunks"])
+            st.caption(f"Bron: `{index_stats['docs_path']}`")
+
+    with st.expander("🔌 Verbindingen"):
+        stats = pool_stats()
+        cols = st.columns(2)
+        cols[0].metric("Open verbindingen", stats["open_connections"])
+        cols[1].metric("Hergebruik", f"{stats['reuse_ratio']:.0%}")
+        st.caption(f"{stats['requests']} requests, {stats['new_connections']} nieuwe verbindingen, {stats['idle_connections']} idle")
+        limiter_stats = get_limiter().stats()
+        cols = st.columns(2)
+        cols[0].metric("Concurrency limiet", limiter_stats["concurrency_limit"])
+        cols[1].metric("Throttled (429)", limiter_stats["throttled"])
+        st.caption(f"{limiter_stats['in_flight']} calls actief, {limiter_stats['retries']} retries")
+        hedge_stats = get_hedge_stats().stats()
+        cols = st.columns(2)
+        cols[0].metric("Hedges gestart", hedge_stats["fired"])
+        cols[1].metric("Hedges gewonnen", hedge_stats["won"])
+        if hedge_stats["thresholds_ms"]:
+            st.caption("Drempels: " + ", ".join(f"{s} {ms} ms" for s, ms in sorted(hedge_stats["thresholds_ms"].items())))
+
+    with st.expander("⏳ Achtergrondjobs"):
+        sessie_jobs = get_job_manager().jobs_for(st.session_state.app_state.session_id)
+        actief = [job for job in sessie_jobs if not job.done]
+        mislukt = [job for job in sessie_jobs if job.status == FAILED]
+        cols = st.columns(2)
+        cols[0].metric("Actief", len(actief))
+        cols[1].metric("Mislukt", len(mislukt))
+        for job in sorted(sessie_jobs, key=lambda job: job.created, reverse=True):
+            duur = (job.finished or time.time()) - job.created
+            st.caption(f"**{job.label}**: {job.status}, {duur:.1f}s")
+
+    with st.expander("🧠 Prefix cache (provider)"):
+        usage_summary = get_usage_stats().summary()
+        st.metric("Cache hit rate", f"{usage_summary['cache_hit_rate']:.0%}",
+                  help="Aandeel prompt tokens dat de provider uit zijn prefix cache serveerde")
+        for stage, totals in sorted(usage_summary["stages"].items()):
+            st.caption(
+                f"**{stage}**: {totals['calls']} calls, {totals['cache_hit_rate']:.0%} hit "
+                f"({totals['cache_hit_tokens']}/{totals['cache_hit_tokens'] + totals['cache_miss_tokens']} tokens)"
+            )
     
     st.divider()
     st.header("📚 Geschiedenis")
     
-    if not st.session_state.app_state.history:
-        st.info("Geen geschiedenis beschikbaar")
+    zoekterm = st.text_input("🔍 Zoeken", placeholder="Zoek in prompts en resultaten...")
+    if zoekterm != st.session_state.get("history_query", ""):
+        st.session_state.history_query = zoekterm
+        st.session_state.app_state.history_page = 0
+
+    page_size = 10
+    store = get_history_store()
+    totaal = store.count(zoekterm)
+    paginas = max((totaal + page_size - 1) // page_size, 1)
+    pagina = min(st.session_state.app_state.history_page, paginas - 1)
+    st.session_state.app_state.history_page = pagina
+    items = store.page(zoekterm, offset=pagina * page_size, limit=page_size)
+
+    if not items:
+        st.info("Geen resultaten" if zoekterm else "Geen geschiedenis beschikbaar")
     else:
-        for idx, item in enumerate(st.session_state.app_state.history):
+        for item in items:
             with st.expander(f"📌 {item['timestamp']}", expanded=False):
                 st.caption(f"Prompt: {item['prompt'][:100]}...")
+                if item["snippet"]:
+                    st.caption(item["snippet"])
                 
-                if item['responses'].get('verfijnd'):
+                if item["verfijnd"]:
                     st.success("✓ Verfijnd")
                 
                 cols = st.columns([3,1])
                 with cols[0]:
-                    if st.button("Laden", key=f"load_{idx}"):
-                        st.session_state.app_state.current_responses = item["responses"]
+                    if st.button("Laden", key=f"load_{item['id']}"):
+                        entry = store.get(item["id"])
+                        nieuwe_story(entry["responses"])
+                        st.session_state.app_state.history_id = entry["id"]
+                        st.session_state.app_state.history_saved = entry["responses"].copy()
                         st.rerun()
                 with cols[1]:
-                    if st.button("❌", key=f"del_{idx}"):
-                        st.session_state.app_state.history.pop(idx)
+                    if st.button("❌", key=f"del_{item['id']}"):
+                        store.delete(item["id"])
+                        if st.session_state.app_state.history_id == item["id"]:
+                            st.session_state.app_state.history_id = None
                         st.rerun()
 
+        cols = st.columns([1, 2, 1])
+        with cols[0]:
+            if st.button("◀", disabled=pagina == 0, key="history_prev"):
+                st.session_state.app_state.history_page -= 1
+                st.rerun()
+        cols[1].caption(f"Pagina {pagina + 1}/{paginas} ({totaal})")
+        with cols[2]:
+            if st.button("▶", disabled=pagina + 1 >= paginas, key="history_next"):
+                st.session_state.app_state.history_page += 1
+                st.rerun()
+
 # --- Hoofdcontent ---
 tab_main, tab_chat, tab_export = st.tabs(["🏠 Refinement", "💬 Team Chat", "📤 Export"])
 
@@ -219,32 +563,34 @@ with tab_main:
             if not prompt.strip():
                 st.warning("Voer een prompt in")
             else:
-                with st.status("🔍 AI Team aan het werk...", expanded=True) as status:
-                    st.write("Product Owner schrijft user story...")
-                    st.session_state.app_state.current_responses["teamlid1"] = teamlid_1(prompt)
-                    
-                    st.write("Developer geeft feedback...")
-                    st.session_state.app_state.current_responses["teamlid2"] = teamlid_2(
-                        prompt, 
-                        st.session_state.app_state.current_responses["teamlid1"]
-                    )
-                    
-                    st.write("Tester evalueert...")
-                    st.session_state.app_state.current_responses["arbiter"] = teamlid_3_arbiter(
-                        prompt,
-                        st.session_state.app_state.current_responses["teamlid1"],
-                        st.session_state.app_state.current_responses["teamlid2"]
-                    )
-                    
-                    # Update history
-                    st.session_state.app_state.history.append({
-                        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
-                        "prompt": prompt,
-                        "responses": st.session_state.app_state.current_responses.copy()
-                    })
-                    
-                    status.update(label="✅ Refinement voltooid!", state="complete")
-                    st.balloons()
+                match = zoek_semantisch(prompt)
+                if match:
+                    st.session_state.app_state.semantic_match = {**match, "query": prompt}
+                else:
+                    start_refinement(prompt)
+
+        # Aanbieding uit de semantische cache
+        match = st.session_state.app_state.semantic_match
+        if match and match["query"] == prompt:
+            st.info(
+                f"💡 Vergelijkbare refinement gevonden ({match['similarity']:.0%} gelijkenis):\n\n"
+                f"_{match['prompt'][:200]}_"
+            )
+            cols = st.columns(2)
+            with cols[0]:
+                if st.button("♻️ Gebruik bestaande refinement", use_container_width=True):
+                    st.session_state.app_state.semantic_match = None
+                    laad_refinement(prompt, match["responses"])
+                    st.rerun()
+            with cols[1]:
+                if st.button("🔄 Toch opnieuw genereren", use_container_width=True):
+                    st.session_state.app_state.semantic_match = None
+                    # Zelfde prompt zou anders volledig uit de response cache komen
+                    set_options(use_cache=False)
+                    try:
+                        start_refinement(prompt)
+                    finally:
+                        set_options(use_cache=st.session_state.app_state.settings["use_cache"])
 
     # Resultaten Sectie
     if st.session_state.app_state.current_responses["arbiter"]:
@@ -266,16 +612,15 @@ with tab_main:
                 st.markdown(st.session_state.app_state.current_responses["arbiter"])
                 
                 # Story Points schatting
-                if not st.session_state.app_state.current_responses["story_points"]:
-                    with st.spinner("Schatting story points..."):
-                        response = chat_with_teamlid(
-                            "Senior Developer",
-                            f"Geef een Fibonacci story point schatting (1,2,3,5,8,13) voor:\n{st.session_state.app_state.current_responses['arbiter']}\n\nMotivatie:"
-                        )
-                        st.session_state.app_state.current_responses["story_points"] = response
                 st.divider()
                 st.subheader("📊 Story Points Schatting")
-                st.markdown(st.session_state.app_state.current_responses["story_points"])
+                if not st.session_state.app_state.current_responses["story_points"]:
+                    bereken_artefact("story_points")
+                    if ("story_points" in st.session_state.app_state.artifact_failed
+                            and "story_points" not in st.session_state.app_state.jobs
+                            and st.button("🔁 Opnieuw schatten")):
+                        bereken_artefact("story_points", force=True)
+                toon_artifact("story_points")
                 
             with tab4:
                 verfijn_prompt = st.text_area(
@@ -287,13 +632,35 @@ with tab_main:
                 if st.button("🔄 Verfijn", use_container_width=True):
                     if verfijn_prompt:
                         with st.spinner("User story verfijnen..."):
-                            refined = verfijn_user_story(
-                                st.session_state.app_state.current_responses["arbiter"],
-                                verfijn_prompt
-                            )
-                            st.session_state.app_state.current_responses["verfijnd"] = refined
-                            st.success("✅ User story verfijnd!")
-                            st.markdown(refined)
+                            # Verder verfijnen op de huidige versie; alleen geraakte secties komen terug
+                            basis = huidige_story(st.session_state.app_state.current_responses)
+                            # De ruwe patch (@@ S2 ...) alleen als voortgang; daarna toont de
+                            # samengevoegde story het resultaat
+                            voortgang = st.empty()
+                            with voortgang.container():
+                                patch = voer_uit(verfijn_secties, basis, verfijn_prompt, toon=False)
+                            voortgang.empty()
+                            refined, gewijzigd = merge_patch(basis, patch) if patch else (None, [])
+                            if gewijzigd:
+                                st.caption(f"Gewijzigde secties: {', '.join(gewijzigd)}")
+                                with st.expander("📄 Verfijnde user story", expanded=True):
+                                    st.markdown(refined)
+                            else:
+                                # Geen bruikbare patch: de hele story opnieuw laten schrijven
+                                refined = voer_uit(verfijn_user_story, basis, verfijn_prompt)
+                            if not refined:
+                                # Beide paden mislukt: de vorige verfijning blijft staan
+                                st.error("❌ Verfijnen mislukt, de user story is niet gewijzigd")
+                            else:
+                                st.session_state.app_state.current_responses["verfijnd"] = refined
+                                # Afgeleide artefacten van de oude story zijn nu verouderd
+                                GRAPH.mark_fresh(
+                                    st.session_state.app_state.current_responses,
+                                    st.session_state.app_state.artifact_inputs,
+                                    ["verfijnd"]
+                                )
+                                bijwerken_artefacten()
+                                st.success("✅ User story verfijnd!")
                     else:
                         st.warning("Voer verfijningsinstructies in")
 
@@ -304,49 +671,87 @@ with tab_main:
             cols = st.columns(3)
             with cols[0]:
                 if st.button("📝 Splits in taken", help="Breek af in kleinere items"):
-                    story_to_split = st.session_state.app_state.current_responses.get("verfijnd") or st.session_state.app_state.current_responses["arbiter"]
-                    with st.spinner("Splitsen..."):
-                        st.session_state.app_state.current_responses["subtaken"] = split_story(story_to_split)
-                    st.markdown(st.session_state.app_state.current_responses["subtaken"])
+                    if not st.session_state.app_state.current_responses["subtaken"]:
+                        bereken_artefact("subtaken", force=True)
+                toon_artifact("subtaken")
                     
             with cols[1]:
                 if st.button("✅ Acceptatiecriteria", help="Genereer Gherkin scenarios"):
-                    story_for_criteria = st.session_state.app_state.current_responses.get("verfijnd") or st.session_state.app_state.current_responses["arbiter"]
-                    with st.spinner("Genereren..."):
-                        st.session_state.app_state.current_responses["acceptatie"] = analyse_acceptatiecriteria(story_for_criteria)
-                    st.code(st.session_state.app_state.current_responses["acceptatie"], language="gherkin")
+                    if not st.session_state.app_state.current_responses["acceptatie"]:
+                        bereken_artefact("acceptatie", force=True)
+                toon_artifact("acceptatie", render=lambda tekst: st.code(tekst, language="gherkin"))
                     
             with cols[2]:
                 if st.button("⚠️ Risico Analyse", help="Identificeer potentiële risico's"):
                     if not st.session_state.app_state.current_responses["risico_analyse"]:
-                        with st.spinner("Analyse..."):
-                            response = chat_with_teamlid(
-                                "Tester",
-                                f"Geef een risicoanalyse voor:\n{st.session_state.app_state.current_responses['arbiter']}\n\nCategoriseer in: Technisch, Organisatorisch, Planning"
-                            )
-                            st.session_state.app_state.current_responses["risico_analyse"] = response
-                    st.markdown(st.session_state.app_state.current_responses["risico_analyse"])
+                        bereken_artefact("risico_analyse", force=True)
+                toon_artifact("risico_analyse")
+
+        if (st.session_state.app_state.current_responses["subtaken"]
+                and "subtaken" not in st.session_state.app_state.jobs):
+            with st.container(border=True):
+                st.subheader("🗺️ Takenstructuur")
+                toon_taakgraaf(st.session_state.app_state.current_responses["subtaken"])
 
 with tab_chat:
     # Chat Interface
     with st.container(border=True):
-        col1, col2 = st.columns([1,3])
-        with col1:
-            role = st.selectbox("Teamlid", ["Product Owner", "Senior Developer", "Tester"])
-        with col2:
-            question = st.text_input("Stel je vraag", placeholder="Typ je vraag hier...")
-            
-        if question:
-            with st.spinner(f"{role} denkt na..."):
-                answer = chat_with_teamlid(role, question)
-                st.session_state.app_state.chat_history.append({
-                    "role": role,
-                    "question": question,
-                    "answer": answer,
-                    "time": datetime.datetime.now().strftime("%H:%M")
-                })
-                
-            st.markdown(f"**{role}:** {answer}")
+        # Een form verstuurt de vraag precies één keer; reruns (sliders, tabs) doen niets
+        with st.form("chat_form", clear_on_submit=True, border=False):
+            col1, col2 = st.columns([1,3])
+            with col1:
+                role = st.selectbox("Teamlid", ["Product Owner", "Senior Developer", "Tester"])
+            with col2:
+                question = st.text_input("Stel je vraag", placeholder="Typ je vraag hier...")
+            submitted = st.form_submit_button("💬 Vraag stellen")
+
+        app_state = st.session_state.app_state
+        budget = app_state.settings["chat_context_tokens"]
+        verwerk_chat_samenvattingen()
+        if submitted and question.strip():
+            # Loopt er nog een antwoord, dan wacht de vraag zijn beurt af in plaats van te verdwijnen
+            app_state.chat_queue.append({
+                "id": uuid.uuid4().hex, "role": role, "question": question,
+                "time": datetime.datetime.now().strftime("%H:%M")
+            })
+
+        pending = app_state.chat_pending
+        if pending:
+            job = get_job_manager().get(pending["job_id"])
+            if job is None or job.done:
+                app_state.chat_pending = None
+                if job is not None and job.status == DONE:
+                    if not any(m.get("id") == pending["id"] for m in app_state.chat_history):
+                        app_state.chat_history.append({
+                            "id": pending["id"],
+                            "role": pending["role"],
+                            "question": pending["question"],
+                            "answer": job.result,
+                            "time": pending["time"]
+                        })
+                        voeg_chatbeurt_toe(pending["role"], pending["question"], job.result, budget)
+                else:
+                    # Geen nep-antwoord in de geschiedenis: de vraag blijft staan voor een nieuwe poging
+                    fout = (job.error if job is not None else None) or "Geen antwoord ontvangen"
+                    app_state.chat_failed.append({**pending, "error": fout})
+        for mislukt in list(app_state.chat_failed):
+            st.error(f"**{mislukt['role']}:** {mislukt['question']}\n\n{mislukt['error']}")
+            cols = st.columns(2)
+            if cols[0].button("🔁 Opnieuw vragen", key=f"chat_retry_{mislukt['id']}"):
+                app_state.chat_failed.remove(mislukt)
+                app_state.chat_queue.append({key: mislukt[key] for key in ("id", "role", "question", "time")})
+                st.rerun()
+            if cols[1].button("🗑️ Vraag laten vallen", key=f"chat_drop_{mislukt['id']}"):
+                app_state.chat_failed.remove(mislukt)
+                st.rerun()
+        start_chatvraag(budget)
+
+        pending = app_state.chat_pending
+        if pending:
+            st.markdown(f"**{pending['role']}:** {pending['question']}")
+            toon_job(pending["job_id"])
+        for wachtend in app_state.chat_queue:
+            st.caption(f"⏳ In de wachtrij: **{wachtend['role']}:** {wachtend['question']}")
             
     # Chat Geschiedenis
     if st.session_state.app_state.chat_history:
@@ -364,12 +769,10 @@ with tab_export:
             
             # Jira Export
             with st.expander("🔄 Jira Import"):
-                jira_data = {
-                    "title": "User Story: " + (st.session_state.app_state.current_responses.get("verfijnd") or st.session_state.app_state.current_responses["arbiter"]).split("\n")[0][:100],
-                    "description": st.session_state.app_state.current_responses["arbiter"],
-                    "acceptance": st.session_state.app_state.current_responses.get("acceptatie", ""),
-                    "points": "3"  # Placeholder
-                }
+                jira_data = jira_story_data(
+                    st.session_state.app_state.current_responses,
+                    points="3"  # Placeholder
+                )
                 
                 df = generate_jira_import(jira_data)
                 st.dataframe(df)
@@ -384,13 +787,7 @@ with tab_export:
             
             # Markdown Export
             with st.expander("📝 Markdown"):
-                markdown_content = f"""# User Story\n\n{st.session_state.app_state.current_responses["arbiter"]}\n\n"""
-                if st.session_state.app_state.current_responses.get("verfijnd"):
-                    markdown_content += f"## Verfijnde Versie\n\n{st.session_state.app_state.current_responses['verfijnd']}\n\n"
-                if st.session_state.app_state.current_responses.get("acceptatie"):
-                    markdown_content += f"## Acceptatiecriteria\n\n```gherkin\n{st.session_state.app_state.current_responses['acceptatie']}\n```\n\n"
-                if st.session_state.app_state.current_responses.get("subtaken"):
-                    markdown_content += f"## Opgesplitste Taken\n\n{st.session_state.app_state.current_responses['subtaken']}\n\n"
+                markdown_content = story_markdown(st.session_state.app_state.current_responses)
                 
                 st.download_button(
                     label="📥 Download Markdown",
@@ -424,5 +821,36 @@ with tab_export:
     else:
         st.info("Voer eerst een refinement uit om export opties te zien")
 
+    # Bulk export: gestreamd en gecomprimeerd naar een tijdelijk bestand, zodat
+    # alleen de gzip bytes (en nooit de hele geschiedenis) in het geheugen komen
+    with st.expander("📚 Bulk export geschiedenis"):
+        cols = st.columns(2)
+        export_format = cols[0].selectbox(
+            "Formaat", list(EXPORT_FORMATS), format_func=lambda f: EXPORT_FORMATS[f][0]
+        )
+        export_query = cols[1].text_input("Filter (zoekterm)", key="export_query")
+        cols = st.columns(2)
+        export_since = cols[0].date_input("Vanaf", value=None, key="export_since")
+        export_until = cols[1].date_input("Tot en met", value=None, key="export_until")
+        if st.button("📦 Export maken"):
+            path = os.path.join(tempfile.gettempdir(), f"history_export_{st.session_state.app_state.session_id}.gz")
+            with st.spinner("Export schrijven..."):
+                aantal = write_export(path, export_format, export_query, export_since, export_until)
+            st.session_state.bulk_export = {"path": path, "format": export_format, "count": aantal}
+        export = st.session_state.get("bulk_export")
+        if export and os.path.exists(export["path"]):
+            _, extensie = EXPORT_FORMATS[export["format"]]
+            st.caption(f"{export['count']} stories, {os.path.getsize(export['path']) / 1024:.0f} KB gecomprimeerd")
+            with open(export["path"], "rb") as f:
+                st.download_button(
+                    label="📥 Download export",
+                    data=f,
+                    file_name=f"history_export.{extensie}.gz",
+                    mime="application/gzip"
+                )
+
+# Wijzigingen aan de huidige story persistent maken
+bewaar_geschiedenis()
+
 # --- Einde van de App
 # ---- Extended version
\ No newline at end of file
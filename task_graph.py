@@ -0,0 +1,219 @@
+"""Takenstructuur uit de split_story output, als Graphviz diagram.
+
+De Markdown lijsten (epics, user stories, technische taken) worden omgezet
+naar knopen met een ouder en optionele afhankelijkheden. Per epic wordt een
+apart diagram gemaakt; de SVG's worden gecachet op de hash van hun DOT bron,
+zodat reruns en tabwissels niets opnieuw layouten en een gewijzigde taak
+alleen het diagram van zijn eigen epic opnieuw laat renderen.
+"""
+import hashlib
+import re
+import shutil
+import textwrap
+import threading
+from collections import OrderedDict
+
+EPIC = "epic"
+STORY = "story"
+TAAK = "taak"
+
+# Sectiekop -> soort knoop en id-prefix voor items zonder eigen id
+SECTIES = ((r"epic", EPIC, "E"), (r"stor", STORY, "US"), (r"ta(ak|ken)|task", TAAK, "T"))
+OVERIG = "Overig"  # groep voor items zonder epic
+MAX_KNOPEN = 30  # grotere epics worden per story gerenderd
+
+_ITEM = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+(.*\S)")
+_ID = re.compile(r"^\[?([A-Za-z]{1,3}\d+)\]?\s*[:.)-]\s*(.*)")
+_ANNOTATIE = re.compile(r"\s*\(([^()]*:[^()]*)\)\s*$")
+
+STIJL = {
+    EPIC: 'shape=box style="rounded,filled" fillcolor="#dbeafe"',
+    STORY: 'shape=box style="rounded,filled" fillcolor="#dcfce7"',
+    TAAK: 'shape=note style=filled fillcolor="#fef9c3"',
+}
+
+
+def _annotaties(tekst):
+    """Splits "titel (epic: E1; na: T2, T3)" in titel en {sleutel: [ids]}"""
+    match = _ANNOTATIE.search(tekst)
+    if not match:
+        return tekst, {}
+    velden = {}
+    for deel in match.group(1).split(";"):
+        if ":" in deel:
+            sleutel, waarden = deel.split(":", 1)
+            velden[sleutel.strip().lower()] = [w.strip().upper() for w in waarden.split(",") if w.strip()]
+    return tekst[:match.start()].strip(), velden
+
+
+def parse_taken(tekst):
+    """Zet split_story output om naar een lijst knopen.
+
+    Elke knoop is een dict met id, soort, titel, ouder (id of None) en na
+    (ids waarop de knoop wacht). Items zonder ouder komen onder de enige
+    epic of story als die er maar één is.
+    """
+    knopen = []
+    soort = prefix = None
+    tellers = {}
+    for regel in (tekst or "").splitlines():
+        if regel.lstrip().startswith("#"):
+            kop = regel.lstrip("# ").lower()
+            soort = prefix = None
+            for patroon, s, p in SECTIES:
+                if re.search(patroon, kop):
+                    soort, prefix = s, p
+                    break
+            continue
+        match = _ITEM.match(regel)
+        if not match or soort is None:
+            continue
+        item = match.group(1).strip("[] ")
+        id_match = _ID.match(item)
+        tellers[soort] = tellers.get(soort, 0) + 1
+        if id_match:
+            knoop_id, item = id_match.group(1).upper(), id_match.group(2)
+        else:
+            knoop_id = f"{prefix}{tellers[soort]}"
+        titel, velden = _annotaties(item.replace("**", "").strip("[] "))
+        ouder = (velden.get("story") or velden.get("epic") or [None])[0]
+        knopen.append({"id": knoop_id, "soort": soort, "titel": titel, "ouder": ouder,
+                       "na": velden.get("na", []) + velden.get("afhankelijk", [])})
+
+    ids = {knoop["id"] for knoop in knopen}
+    epics = [k["id"] for k in knopen if k["soort"] == EPIC]
+    stories = [k["id"] for k in knopen if k["soort"] == STORY]
+    for knoop in knopen:
+        if knoop["ouder"] not in ids:
+            knoop["ouder"] = None
+        if knoop["ouder"] is None:
+            if knoop["soort"] == STORY and len(epics) == 1:
+                knoop["ouder"] = epics[0]
+            elif knoop["soort"] == TAAK and len(stories) == 1:
+                knoop["ouder"] = stories[0]
+            elif knoop["soort"] == TAAK and len(epics) == 1:
+                knoop["ouder"] = epics[0]
+        knoop["na"] = [n for n in knoop["na"] if n in ids and n != knoop["id"]]
+    return knopen
+
+
+def voorouders(knopen, soort):
+    """id -> id van de dichtstbijzijnde voorouder (of de knoop zelf) van `soort`, anders None"""
+    per_id = {knoop["id"]: knoop for knoop in knopen}
+    resultaat = {}
+    for knoop in knopen:
+        huidige, gezien = knoop, set()
+        while huidige["soort"] != soort and huidige["ouder"] in per_id and huidige["id"] not in gezien:
+            gezien.add(huidige["id"])
+            huidige = per_id[huidige["ouder"]]
+        resultaat[knoop["id"]] = huidige["id"] if huidige["soort"] == soort else None
+    return resultaat
+
+
+def _label(knoop):
+    titel = "\\n".join(textwrap.wrap(knoop["titel"], 32)[:4]).replace('"', '\\"')
+    return f'{knoop["id"]}\\n{titel}'
+
+
+def dot_bron(knopen, externe=None):
+    """DOT bron voor een set knopen; `externe` zijn ids buiten deze set waarnaar verwezen wordt"""
+    ids = {knoop["id"] for knoop in knopen} | set(externe or ())
+    regels = ["digraph taken {", "  rankdir=LR;", '  node [fontname="Helvetica" fontsize=10];']
+    for knoop in knopen:
+        regels.append(f'  "{knoop["id"]}" [label="{_label(knoop)}" {STIJL[knoop["soort"]]}];')
+    for extern in sorted(externe or ()):
+        regels.append(f'  "{extern}" [style=dashed shape=box color=gray fontcolor=gray];')
+    for knoop in knopen:
+        if knoop["ouder"] in ids:
+            regels.append(f'  "{knoop["ouder"]}" -> "{knoop["id"]}";')
+        for voorganger in knoop["na"]:
+            regels.append(f'  "{voorganger}" -> "{knoop["id"]}" [style=dashed color="#dc2626" label="na"];')
+    regels.append("}")
+    return "\n".join(regels)
+
+
+def _diagram(sleutel, titel, groep):
+    ids = {k["id"] for k in groep}
+    externe = {n for k in groep for n in k["na"] + [k["ouder"]] if n and n not in ids}
+    return sleutel, titel, len(groep), dot_bron(groep, externe)
+
+
+def diagrammen(knopen, max_knopen=MAX_KNOPEN):
+    """DOT bronnen per epic: [(sleutel, titel, aantal knopen, dot)].
+
+    Een epic met meer dan `max_knopen` items wordt opgesplitst in een
+    overzicht (epic + stories) en een diagram per story, zodat een gewijzigde
+    taak maar één klein diagram opnieuw laat layouten. Verwijzingen naar
+    knopen in een ander diagram worden grijs getoond.
+    """
+    epics = voorouders(knopen, EPIC)
+    stories = voorouders(knopen, STORY)
+    titels = {k["id"]: k["titel"] for k in knopen}
+    groepen = OrderedDict()
+    for knoop in knopen:
+        groepen.setdefault(epics[knoop["id"]] or OVERIG, []).append(knoop)
+    resultaat = []
+    for epic, groep in groepen.items():
+        titel = titels.get(epic, OVERIG)
+        if len(groep) <= max_knopen:
+            resultaat.append(_diagram(epic, titel, groep))
+            continue
+        per_story = OrderedDict()
+        overzicht = []
+        for knoop in groep:
+            story = stories[knoop["id"]]
+            if knoop["soort"] == TAAK and story:
+                per_story.setdefault(story, []).append(knoop)
+            else:
+                overzicht.append(knoop)
+        resultaat.append(_diagram(epic, f"{titel} (overzicht)", overzicht))
+        for story, taken in per_story.items():
+            story_knoop = next(k for k in groep if k["id"] == story)
+            resultaat.append(_diagram(story, f"{titel} › {titels[story]}", [story_knoop] + taken))
+    return resultaat
+
+
+class SvgCache:
+    """LRU cache van gerenderde SVG's op basis van de hash van de DOT bron"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.renders = 0
+
+    def svg(self, dot):
+        """SVG voor een DOT bron, of None als de `dot` binary niet beschikbaar is"""
+        key = hashlib.sha256(dot.encode("utf-8")).hexdigest()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        if not kan_renderen():
+            return None
+        import graphviz  # pas laden als er echt gerenderd wordt
+
+        svg = graphviz.Source(dot).pipe(format="svg").decode("utf-8")
+        svg = svg[svg.find("<svg"):]  # zonder XML proloog, zodat st.image het als SVG herkent
+        with self._lock:
+            self.renders += 1
+            self._entries[key] = svg
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return svg
+
+
+def kan_renderen():
+    """True als de graphviz package en de `dot` binary aanwezig zijn"""
+    import importlib.util
+
+    return importlib.util.find_spec("graphviz") is not None and shutil.which("dot") is not None
+
+
+_cache = SvgCache()
+
+
+def get_svg_cache():
+    return _cache
@@ -0,0 +1,397 @@
+import contextvars
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from llm import generate_response, set_options, get_option, report
+import condense
+from chat_context import build_messages, DEFAULT_BUDGET as CHAT_BUDGET
+from sections import split_sections, annotate
+
+# Model voor stages zonder tier; per stage wordt het model gekozen via routing (model_tiers.json)
+DEFAULT_MODEL = "deepseek-chat"
+
+# --- Vaste instructies ---
+# De statische instructies staan altijd vooraan (in het system bericht) en
+# de variabele inhoud achteraan. Zo delen alle calls van een stage hetzelfde
+# prompt-prefix en kan de provider dat uit zijn prefix cache serveren.
+# Wijzig deze teksten niet per call.
+
+TEAMLID_1_INSTRUCTIES = """Je bent een ervaren product owner. Schrijf duidelijke user stories volgens INVEST criteria.
+
+Je krijgt een beschrijving van een feature of verbetering. Schrijf daar een user story voor.
+
+Volg dit format:
+Als een [type gebruiker]
+Wil ik [doel/wens]
+Zodat [waarde/business doel]
+
+Acceptatiecriteria:
+- [Meetbaar criterium 1]
+- [Meetbaar criterium 2]"""
+
+TEAMLID_2_INSTRUCTIES = """Je bent een senior developer. Geef technische feedback en verbeter user stories.
+
+Je krijgt de originele prompt en de user story van de product owner. Geef technische feedback.
+
+Richtlijnen:
+1. Identificeer ontbrekende technische vereisten
+2. Controleer op ambiguïteit
+3. Voeg implementatie details toe waar nodig
+4. Behoud de business waarde"""
+
+TEAMLID_3_INSTRUCTIES = """Je bent een QA engineer. Evalueer user stories en voeg testscenario's toe.
+
+Je krijgt de originele prompt, de versie van de product owner en de feedback van de developer. Evalueer deze user story versies.
+
+Geef:
+1. Een samengevoegde, verbeterde versie
+2. Testscenario's (happy path + edge cases)
+3. Kwaliteitsscore (1-10) met motivatie
+4. Risicoanalyse"""
+
+SPLIT_INSTRUCTIES = """Je bent een agile coach. Splits user stories in kleine, uitvoerbare taken.
+
+Volg dit format. Geef elk item een id en verwijs tussen haakjes naar de epic of story waar het onder valt; vermeld bij taken met "na:" van welke andere taken ze afhangen.
+## Epics
+- E1: [Epic 1]
+- E2: [Epic 2]
+
+## User Stories
+- US1: [US 1] (epic: E1)
+- US2: [US 2] (epic: E2)
+
+## Technische Taken
+- T1: [Taak 1] (story: US1)
+- T2: [Taak 2] (story: US1; na: T1)"""
+
+VERFIJN_INSTRUCTIES = """Je bent een agile coach. Verfijn user stories op basis van feedback.
+
+Je krijgt een user story en verfijningsinstructies. Geef de verfijnde user story terug.
+
+Behoud het INVEST format:
+- Independent
+- Negotiable
+- Valuable
+- Estimable
+- Small
+- Testable"""
+
+VERFIJN_SECTIES_INSTRUCTIES = """Je bent een agile coach. Verfijn user stories op basis van feedback.
+
+Je krijgt een user story die is opgedeeld in secties met ids ([S0], [S1], ...) en verfijningsinstructies. Pas alleen de secties aan die door de instructies geraakt worden en geef uitsluitend die wijzigingen terug, in dit patch format:
+
+@@ S2
+<de volledige nieuwe tekst van sectie S2, inclusief de kop>
+@@ NA S2
+<een nieuwe sectie die na S2 wordt ingevoegd, met kop>
+@@ WEG S4
+
+Herhaal geen ongewijzigde secties, laat de [S..] markers weg uit de sectietekst en geef geen toelichting buiten de patch. Behoud het INVEST format."""
+
+ACCEPTATIE_INSTRUCTIES = """Je bent een QA engineer. Schrijf acceptatiecriteria als Gherkin scenario's.
+
+Je krijgt een user story. Geef alleen Gherkin (Feature, Scenario, Given/When/Then), met happy path en edge cases, zonder verdere uitleg."""
+
+ROL_INSTRUCTIES = {
+    "Product Owner": "Je bent een product owner. Beantwoord vragen vanuit business perspectief.",
+    "Senior Developer": "Je bent een senior developer. Beantwoord vanuit technisch perspectief.",
+    "Tester": "Je bent een QA engineer. Richt je op testbaarheid en kwaliteit."
+}
+
+SAMENVATTING_INSTRUCTIES = """Je vat een gesprek tussen een gebruiker en een scrum teamlid samen.
+
+Je krijgt de bestaande samenvatting (mogelijk leeg) en nieuwe gespreksbeurten. Geef één bijgewerkte, beknopte samenvatting met alle besluiten, feiten, open vragen en afspraken die nodig zijn om het gesprek voort te zetten. Geen inleiding, alleen de samenvatting."""
+
+INPUT_DEEL_INSTRUCTIES = """Je vat een deel van een lange specificatie samen voor een scrum team dat er user stories van maakt.
+
+Behoud alle functionele eisen, niet-functionele eisen, rollen, data, randvoorwaarden, afhankelijkheden en open vragen; concrete getallen, namen en regels letterlijk. Laat herhaling, opmaak en inleidende tekst weg. Geen inleiding, alleen de samenvatting."""
+
+INPUT_BRIEF_INSTRUCTIES = """Je combineert samenvattingen van de delen van een lange specificatie tot één beknopte brief voor een scrum refinement.
+
+Gebruik de kopjes: Doel, Gebruikers en rollen, Functionele eisen, Niet-functionele eisen, Randvoorwaarden en afhankelijkheden, Open vragen. Voeg dubbele punten samen en laat niets weg dat een eis of beperking is. Geen inleiding."""
+
+STORY_POINTS_INSTRUCTIES = ROL_INSTRUCTIES["Senior Developer"] + """
+
+Geef een Fibonacci story point schatting (1,2,3,5,8,13) voor de user story die je krijgt, gevolgd door een motivatie."""
+
+RISICO_INSTRUCTIES = ROL_INSTRUCTIES["Tester"] + """
+
+Geef een risicoanalyse voor de user story die je krijgt. Categoriseer in: Technisch, Organisatorisch, Planning"""
+
+# Snelle modus: product owner, developer, arbiter en story points in één call.
+# De secties worden met vaste markers gescheiden, zodat het antwoord gestreamd
+# kan worden en daarna terug te splitsen is naar de current_responses keys.
+SNELLE_SECTIES = {
+    "PRODUCT_OWNER": "teamlid1",
+    "DEVELOPER": "teamlid2",
+    "ARBITER": "arbiter",
+    "STORY_POINTS": "story_points"
+}
+
+SNELLE_REFINEMENT_INSTRUCTIES = f"""Je bent een compleet scrum team (product owner, senior developer en QA engineer) dat in één keer een feature verfijnt.
+
+Je krijgt een beschrijving van een feature of verbetering. Werk de vier rollen hieronder na elkaar uit en begin elke sectie met exact de marker op een eigen regel.
+
+### PRODUCT_OWNER
+{TEAMLID_1_INSTRUCTIES}
+
+### DEVELOPER
+{TEAMLID_2_INSTRUCTIES}
+Geef deze feedback op de user story uit de PRODUCT_OWNER sectie.
+
+### ARBITER
+{TEAMLID_3_INSTRUCTIES}
+Evalueer de PRODUCT_OWNER versie en de DEVELOPER feedback.
+
+### STORY_POINTS
+{STORY_POINTS_INSTRUCTIES}
+Schat de samengevoegde versie uit de ARBITER sectie.
+
+Gebruik geen andere regels die met ### beginnen."""
+
+# --- Verbeterde Teamlid Functies ---
+def documentatie(prompt):
+    """Relevante stukken uit de docs index als blok voor de user message, of "".
+
+    Leeg zonder docs map, zonder chromadb/sentence-transformers, bij een
+    fout in de index of als retrieval uit staat (optie use_docs /
+    DOCS_RETRIEVAL=0). Eén keer per refinement berekenen en via `docs` aan
+    teamlid_2 en de arbiter meegeven.
+    """
+    if not get_option("use_docs", os.getenv("DOCS_RETRIEVAL", "1") == "1"):
+        return ""
+    import docs_index
+    if not os.path.isdir(os.getenv("DOCS_PATH", docs_index.DEFAULT_DOCS_PATH)):
+        return ""
+    try:
+        index = docs_index.get_docs_index()
+        context = index.context_for(prompt) if index else ""
+    except Exception as e:
+        # Zonder documentatie gaat de refinement gewoon door
+        report(f"Documentatie index niet beschikbaar: {str(e)}")
+        return ""
+    return f"Relevante projectdocumentatie:\n{context}\n\n" if context else ""
+
+def teamlid_1(prompt, stream=False):
+    messages = [
+        {"role": "system", "content": TEAMLID_1_INSTRUCTIES},
+        {"role": "user", "content": f"Beschrijving:\n{prompt}"}
+    ]
+    return generate_response(DEFAULT_MODEL, messages, stream=stream, stage="teamlid1")
+
+def teamlid_2(prompt, teamlid1_output, stream=False, docs=None):
+    docs = documentatie(prompt) if docs is None else docs
+    messages = [
+        {"role": "system", "content": TEAMLID_2_INSTRUCTIES},
+        {"role": "user", "content": f"Originele prompt:\n{prompt}\n\n{docs}"
+                                    f"User story:\n{teamlid1_output}"}
+    ]
+    return generate_response(DEFAULT_MODEL, messages, stream=stream, stage="teamlid2")
+
+def teamlid_3_arbiter(prompt, teamlid1_output, teamlid2_output, stream=False, docs=None):
+    docs = documentatie(prompt) if docs is None else docs
+    messages = [
+        {"role": "system", "content": TEAMLID_3_INSTRUCTIES},
+        {"role": "user", "content": f"Originele prompt:\n{prompt}\n\n{docs}"
+                                    f"Product Owner versie:\n{teamlid1_output}\n\n"
+                                    f"Developer feedback:\n{teamlid2_output}"}
+    ]
+    return generate_response(DEFAULT_MODEL, messages, stream=stream, stage="arbiter")
+
+def split_story(final_story, stream=False):
+    messages = [
+        {"role": "system", "content": SPLIT_INSTRUCTIES},
+        {"role": "user", "content": f"Splits deze user story:\n{final_story}"}
+    ]
+    return generate_response(DEFAULT_MODEL, messages, stream=stream, stage="split_story")
+
+def chat_with_teamlid(role, vraag, context=None, budget=CHAT_BUDGET, *, stream=False):
+    """Chatvraag aan een teamlid; met `context` (zie chat_context) wordt het een doorlopend gesprek.
+
+    `stream` is keyword-only: JobManager roept fn(*args, stream=True) aan met
+    de context en het budget als positionele argumenten.
+    """
+    messages = build_messages(ROL_INSTRUCTIES.get(role, f"Je bent een {role}"), context, vraag, budget)
+    return generate_response(DEFAULT_MODEL, messages, stream=stream, stage="chat")
+
+def vat_gesprek_samen(samenvatting, beurten, stream=False):
+    gesprek = "\n\n".join(f"Gebruiker: {b['question']}\nTeamlid: {b['answer']}" for b in beurten)
+    messages = [
+        {"role": "system", "content": SAMENVATTING_INSTRUCTIES},
+        {"role": "user", "content": f"Bestaande samenvatting:\n{samenvatting or '(leeg)'}\n\nNieuwe beurten:\n{gesprek}"}
+    ]
+    return generate_response(DEFAULT_MODEL, messages, max_tokens=600, stream=stream, stage="chat_samenvatting")
+
+def verfijn_user_story(final_story, verfijnings_prompt, stream=False):
+    messages = [
+        {"role": "system", "content": VERFIJN_INSTRUCTIES},
+        {"role": "user", "content": f"User story:\n{final_story}\n\nVerfijningsinstructies:\n{verfijnings_prompt}"}
+    ]
+    return generate_response(DEFAULT_MODEL, messages, stream=stream, stage="verfijn")
+
+def verfijn_secties(final_story, verfijnings_prompt, stream=False):
+    """Verfijn alleen de geraakte secties; geeft een patch terug (zie sections.merge_patch)"""
+    messages = [
+        {"role": "system", "content": VERFIJN_SECTIES_INSTRUCTIES},
+        {"role": "user", "content": f"User story:\n{annotate(split_sections(final_story))}\n\n"
+                                    f"Verfijningsinstructies:\n{verfijnings_prompt}"}
+    ]
+    return generate_response(DEFAULT_MODEL, messages, stream=stream, stage="verfijn_patch")
+
+def analyse_acceptatiecriteria(final_story, stream=False):
+    messages = [
+        {"role": "system", "content": ACCEPTATIE_INSTRUCTIES},
+        {"role": "user", "content": final_story}
+    ]
+    return generate_response(DEFAULT_MODEL, messages, stream=stream, stage="acceptatie")
+
+def schat_story_points(final_story, stream=False):
+    messages = [
+        {"role": "system", "content": STORY_POINTS_INSTRUCTIES},
+        {"role": "user", "content": final_story}
+    ]
+    return generate_response(DEFAULT_MODEL, messages, stream=stream, stage="story_points")
+
+def risico_analyse(final_story, stream=False):
+    messages = [
+        {"role": "system", "content": RISICO_INSTRUCTIES},
+        {"role": "user", "content": final_story}
+    ]
+    return generate_response(DEFAULT_MODEL, messages, stream=stream, stage="risico_analyse")
+
+def vat_input_deel_samen(deel, index, totaal, stream=False):
+    messages = [
+        {"role": "system", "content": INPUT_DEEL_INSTRUCTIES},
+        {"role": "user", "content": f"Deel {index} van {totaal}:\n{deel}"}
+    ]
+    return generate_response(DEFAULT_MODEL, messages, max_tokens=800, stream=stream, stage="input_deel")
+
+def combineer_input(samenvattingen, stream=False):
+    delen = "\n\n".join(f"--- Deel {i} ---\n{tekst}" for i, tekst in enumerate(samenvattingen, 1))
+    messages = [
+        {"role": "system", "content": INPUT_BRIEF_INSTRUCTIES},
+        {"role": "user", "content": delen}
+    ]
+    return generate_response(DEFAULT_MODEL, messages, max_tokens=2000, stream=stream, stage="input_brief")
+
+def _parallel(fn, argumenten):
+    """Roep fn parallel aan met de call-opties van de aanroeper; None als een call mislukt"""
+    errors = []
+
+    def run(args):
+        set_options(on_error=errors.append)  # UI callbacks werken niet vanuit worker threads
+        return fn(*args)
+
+    # Context hier vastleggen: copy_context() in de worker zou de lege context van die thread kopiëren
+    context = contextvars.copy_context()
+    workers = int(os.getenv("LONG_INPUT_WORKERS", condense.DEFAULT_WORKERS))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-condense") as pool:
+        results = list(pool.map(lambda args: context.copy().run(run, args), argumenten))
+    for message in errors:
+        report(message)
+    return None if not all(results) else results
+
+def condenseer_input(prompt):
+    """Map-reduce voor lange invoer: delen parallel samenvatten en combineren tot één brief.
+
+    Korte invoer komt ongewijzigd terug; bij een mislukte call None.
+    """
+    if not condense.needs_condensing(prompt):
+        return prompt
+    delen = condense.chunk_text(prompt)
+    samenvattingen = _parallel(vat_input_deel_samen, [(deel, i, len(delen)) for i, deel in enumerate(delen, 1)])
+    # Te veel samenvattingen voor één combineer-call: eerst in groepen combineren
+    while samenvattingen and condense.tokens("\n\n".join(samenvattingen)) > condense.REDUCE_INPUT_TOKENS:
+        groepen = condense.pack(samenvattingen, condense.REDUCE_INPUT_TOKENS * 4)
+        if len(groepen) >= len(samenvattingen):
+            break
+        samenvattingen = _parallel(combineer_input, [([groep],) for groep in groepen])
+    return combineer_input(samenvattingen) if samenvattingen else None
+
+def refine(prompt):
+    """Voer de volledige keten teamlid_1 -> teamlid_2 -> arbiter uit (zonder UI).
+
+    Lange invoer wordt eerst samengevat (zie condenseer_input). Stopt bij de
+    eerste mislukte stap en geeft dan None terug.
+    """
+    prompt = condenseer_input(prompt)
+    if not prompt:
+        return None
+    responses = {"teamlid1": teamlid_1(prompt)}
+    if not responses["teamlid1"]:
+        return None
+    docs = documentatie(prompt)
+    responses["teamlid2"] = teamlid_2(prompt, responses["teamlid1"], docs=docs)
+    if not responses["teamlid2"]:
+        return None
+    responses["arbiter"] = teamlid_3_arbiter(prompt, responses["teamlid1"], responses["teamlid2"], docs=docs)
+    if not responses["arbiter"]:
+        return None
+    return responses
+
+def snelle_refinement(prompt, stream=False):
+    """Eén gestructureerde call voor de hele keten (zie SNELLE_REFINEMENT_INSTRUCTIES)"""
+    messages = [
+        {"role": "system", "content": SNELLE_REFINEMENT_INSTRUCTIES},
+        {"role": "user", "content": f"Beschrijving:\n{prompt}"}
+    ]
+    return generate_response(DEFAULT_MODEL, messages, max_tokens=8000, stream=stream, stage="snelle_refinement")
+
+def parse_snelle_refinement(text):
+    """Splits het antwoord van snelle_refinement in current_responses keys.
+
+    Zonder herkenbare markers komt de volledige tekst in "arbiter" terecht,
+    zodat de tabs en exports altijd iets te tonen hebben.
+    """
+    responses = {key: "" for key in SNELLE_SECTIES.values()}
+    if not text:
+        return None
+    delen = re.split(r"^\s*#{2,3}\s*(PRODUCT_OWNER|DEVELOPER|ARBITER|STORY_POINTS)\s*$", text, flags=re.MULTILINE)
+    for marker, inhoud in zip(delen[1::2], delen[2::2]):
+        responses[SNELLE_SECTIES[marker]] = inhoud.strip()
+    if not responses["arbiter"]:
+        responses["arbiter"] = text.strip()
+    return responses
+
+def refine_snel(prompt):
+    """Snelle variant van refine(): één call, zelfde keys plus story_points"""
+    prompt = condenseer_input(prompt)
+    if not prompt:
+        return None
+    return parse_snelle_refinement(snelle_refinement(prompt))
+
+def parse_story_points(text, default="3"):
+    """Haal het eerste Fibonacci getal uit een story point schatting"""
+    for match in re.findall(r"\b(1|2|3|5|8|13)\b", text or ""):
+        return match
+    return default
+
+def jira_story_data(responses, points="3"):
+    """Zet een set responses om naar de velden van de Jira export"""
+    story = responses.get("verfijnd") or responses["arbiter"]
+    return {
+        "title": "User Story: " + story.split("\n")[0][:100],
+        "description": responses["arbiter"],
+        "acceptance": responses.get("acceptatie", ""),
+        "points": points
+    }
+
+JIRA_COLUMNS = ["Summary", "Description", "Acceptance Criteria", "Story Points", "Component", "Labels"]
+
+def jira_row(story_data):
+    """Eén rij voor de Jira CSV, in de kolomvolgorde van JIRA_COLUMNS"""
+    return dict(zip(JIRA_COLUMNS, [
+        story_data["title"],
+        story_data["description"],
+        story_data["acceptance"],
+        story_data["points"],
+        "Backend",
+        "generated"
+    ]))
+
+def generate_jira_import(story_data):
+    """Genereer CSV voor Jira import"""
+    import pandas as pd  # alleen nodig voor deze export, niet bij het opstarten
+
+    return pd.DataFrame([jira_row(story_data)], columns=JIRA_COLUMNS)
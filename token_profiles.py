@@ -0,0 +1,115 @@
+"""max_tokens per stage: vast ingesteld of geleerd uit eerdere outputlengtes.
+
+Een story point schatting heeft geen 5000 tokens nodig. Zolang een stage
+te weinig calls in het grootboek heeft geldt de limiet van de aanroep zelf
+(geen gok die antwoorden afkapt); daarna wordt de limiet het p99 van de
+werkelijke outputlengtes plus marge. Een krappere limiet verlaagt de
+latency bij de provider en stopt op hol geslagen generaties. Wordt een
+antwoord toch afgekapt, dan groeit de limiet van die stage weer.
+"""
+import json
+import math
+import os
+import threading
+import time
+
+from ledger import get_ledger
+
+# Bekende stages, voor het overzicht in de sidebar
+STAGES = (
+    "teamlid1", "teamlid2", "arbiter", "split_story", "verfijn", "verfijn_patch", "acceptatie",
+    "story_points", "risico_analyse", "chat", "chat_samenvatting", "snelle_refinement",
+    "input_deel", "input_brief",
+)
+DEFAULT_HEADROOM = 1.25
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_WINDOW = 500  # laatste N calls per stage
+MIN_TOKENS = 128
+REFRESH_SECONDS = 60
+
+
+def percentile(values, pct):
+    """Nearest-rank percentiel"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(int(math.ceil(pct / 100.0 * len(ordered))) - 1, 0)
+    return ordered[index]
+
+
+class TokenProfiles:
+    """Limieten per stage. Volgorde: TOKEN_PROFILES (vast) > geleerd > limiet van de aanroep"""
+
+    def __init__(self, fixed=None, headroom=None, min_samples=None, learn=None):
+        self.fixed = fixed if fixed is not None else json.loads(os.getenv("TOKEN_PROFILES") or "{}")
+        self.headroom = headroom or float(os.getenv("TOKEN_PROFILE_HEADROOM", DEFAULT_HEADROOM))
+        self.min_samples = min_samples or int(os.getenv("TOKEN_PROFILE_MIN_SAMPLES", DEFAULT_MIN_SAMPLES))
+        self.learn = learn if learn is not None else os.getenv("TOKEN_PROFILE_LEARN", "1") != "0"
+        self._lock = threading.Lock()
+        self._learned = {}  # stage -> (p99, aantal samples, tijdstip)
+        self._truncated = {}  # stage -> aantal afgekapte antwoorden
+        self._boost = {}  # stage -> vermenigvuldiger na afkappen
+
+    def _observed(self, stage):
+        with self._lock:
+            cached = self._learned.get(stage)
+        if cached and time.monotonic() - cached[2] < REFRESH_SECONDS:
+            return cached
+        values = get_ledger().completion_tokens(stage, DEFAULT_WINDOW)
+        cached = (percentile(values, 99), len(values), time.monotonic())
+        with self._lock:
+            self._learned[stage] = cached
+        return cached
+
+    def learned(self, stage):
+        """Geleerde limiet (p99 x marge, afgerond op 64) of None bij te weinig samples"""
+        if not self.learn or not stage:
+            return None
+        p99, samples, _ = self._observed(stage)
+        if samples < self.min_samples:
+            return None
+        return max(int(math.ceil(p99 * self.headroom / 64.0)) * 64, MIN_TOKENS)
+
+    def limit(self, stage, requested):
+        """De max_tokens voor een call van `stage`; nooit boven `requested`"""
+        if stage in self.fixed:
+            return min(int(self.fixed[stage]), requested)
+        learned = self.learned(stage)
+        if learned is None:
+            return requested
+        return min(int(learned * self._boost.get(stage, 1.0)), requested)
+
+    def truncated(self, stage):
+        """Meld een afgekapt antwoord (finish_reason "length"): de limiet groeit"""
+        with self._lock:
+            self._truncated[stage] = self._truncated.get(stage, 0) + 1
+            self._boost[stage] = min(self._boost.get(stage, 1.0) * 1.5, 4.0)
+
+    def summary(self, ceiling):
+        """Per stage: vast, geleerd, samples, afgekapt en de actieve limiet onder `ceiling`"""
+        stages = set(STAGES) | set(self.fixed) | set(self._truncated)
+        rows = []
+        for stage in sorted(stages):
+            p99, samples, _ = self._observed(stage) if self.learn else (0, 0, 0)
+            rows.append({
+                "stage": stage,
+                "fixed": self.fixed.get(stage),
+                "p99": p99,
+                "samples": samples,
+                "learned": self.learned(stage),
+                "truncated": self._truncated.get(stage, 0),
+                "limit": self.limit(stage, ceiling),
+            })
+        return rows
+
+
+_profiles = None
+_profiles_lock = threading.Lock()
+
+
+def get_token_profiles():
+    global _profiles
+    with _profiles_lock:
+        if _profiles is None:
+            _profiles = TokenProfiles()
+        return _profiles
@@ -0,0 +1,68 @@
+import threading
+
+
+def normalize_usage(usage):
+    """Zet een usage object van de API om naar een dict met vaste velden.
+
+    DeepSeek geeft naast prompt/completion tokens ook prompt_cache_hit_tokens
+    en prompt_cache_miss_tokens terug (prefix caching aan providerkant).
+    """
+    if usage is None:
+        return None
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    hit = getattr(usage, "prompt_cache_hit_tokens", None)
+    if hit is None:
+        # OpenAI-stijl: usage.prompt_tokens_details.cached_tokens
+        details = getattr(usage, "prompt_tokens_details", None)
+        hit = getattr(details, "cached_tokens", 0) if details else 0
+    hit = hit or 0
+    miss = getattr(usage, "prompt_cache_miss_tokens", None)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "cache_hit_tokens": hit,
+        "cache_miss_tokens": miss if miss is not None else max(prompt_tokens - hit, 0)
+    }
+
+
+class UsageStats:
+    """Proces-brede tellers van token gebruik per stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    def record(self, stage, usage):
+        if usage is None:
+            return
+        with self._lock:
+            totals = self.stages.setdefault(stage or "overig", {
+                "calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "cache_hit_tokens": 0, "cache_miss_tokens": 0
+            })
+            totals["calls"] += 1
+            for field, value in usage.items():
+                totals[field] += value
+
+    def summary(self):
+        """Totalen per stage plus de prefix cache hit rate"""
+        with self._lock:
+            stages = {stage: dict(totals) for stage, totals in self.stages.items()}
+        for totals in stages.values():
+            cached = totals["cache_hit_tokens"] + totals["cache_miss_tokens"]
+            totals["cache_hit_rate"] = totals["cache_hit_tokens"] / cached if cached else 0.0
+        hit = sum(t["cache_hit_tokens"] for t in stages.values())
+        miss = sum(t["cache_miss_tokens"] for t in stages.values())
+        return {
+            "stages": stages,
+            "cache_hit_tokens": hit,
+            "cache_miss_tokens": miss,
+            "cache_hit_rate": hit / (hit + miss) if hit + miss else 0.0
+        }
+
+
+_stats = UsageStats()
+
+
+def get_usage_stats():
+    return _stats